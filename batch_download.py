@@ -6,59 +6,112 @@
   python batch_download.py                    # 自动扫描webpage目录
   python batch_download.py resources.json     # 下载指定文件
   python batch_download.py --all              # 下载webpage目录所有资源
+
+选项:
+  --keep-query=v,id    只保留指定的查询参数(默认保留缓存破坏参数以外的全部参数,--keep-query=none 全部去掉)
+  --verify             只校验已下载文件(大小/修改时间不变的文件不重新计算摘要)
+  --repair             校验并重新下载缺失、损坏或未索引的文件
+  --verify=full        所有文件都重新计算摘要(--repair=full同理)
+  --bandwidth=2M       总带宽上限,超过5MB的大文件最多占用其中30%(--bulk-share=0.3)
+
+多进程/多机器任务队列(SQLite,共享文件系统上的多台机器可以使用同一个数据库):
+  python batch_download.py --all --queue=queue.db          # 把资源加入队列(全局去重)
+  python batch_download.py --queue=queue.db --worker       # 启动一个下载进程
+  python batch_download.py --queue=queue.db --workers=4    # 在本机启动4个下载进程(--bandwidth平均分给各进程)
+  python batch_download.py --queue=queue.db --status       # 查看进度
+  python batch_download.py --queue=queue.db --update-index # 重新把下载结果写入各目录的完整性索引
 """
 
 import json
-import requests
+import os
 import sys
 from pathlib import Path
-from urllib.parse import urlparse, unquote
 import time
 import glob
+import hashlib
+import threading
+import multiprocessing
+
+from url_canon import UrlCanonicalizer, parse_keep_query
+from integrity import IntegrityIndex, OK, UNINDEXED
+from work_queue import WorkQueue, new_worker_id
+from scheduler import BandwidthScheduler, priority_of, parse_rate
+
+# 默认只去掉缓存破坏参数,见url_canon.canonicalize_url
+KEEP_QUERY_PARAMS = '*'
+
+# 需要下载的类别及其子目录(跳过html、images和other)
+CATEGORY_DIRS = {
+    'javascript': 'js',
+    'css': 'css'
+}
+SKIP_CATEGORIES = ['html', 'images', 'other']
+
+# 按优先级限速,默认不限速
+SCHEDULER = BandwidthScheduler()
+
+
+def _default_ext(category):
+    """无文件名时使用的扩展名"""
+    return {
+        'javascript': '.js',
+        'css': '.css',
+        'images': '.png'
+    }.get(category, '.bin')
+
+
+def fetch_to_file(url, filepath, index=None, category='javascript'):
+    """下载url并原子写入filepath,返回下载的内容"""
+    content, response = SCHEDULER.fetch(url, category)
+    
+    # 检查内容是否完整(压缩传输时Content-Length是压缩后的大小,无法比较)
+    expected = response.headers.get('Content-Length')
+    if expected and not response.headers.get('Content-Encoding'):
+        if int(expected) != len(content):
+            raise IOError(f"内容不完整: {len(content)}/{expected} bytes")
+    
+    # 先写临时文件再替换,中断时不会留下截断的文件
+    filepath = Path(filepath)
+    tmp_path = filepath.with_name(filepath.name + '.part')
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, filepath)
+    if index:
+        index.record(filepath, url, content)
+    return content
 
 
-def download_file(url, save_dir, category):
-    """下载单个文件"""
+def download_file(url, save_dir, category, canon=None, index=None, force=False):
+    """下载单个文件
+    
+    index为完整性索引时,已存在的文件先校验再跳过;force=True时总是重新下载
+    """
     try:
-        # 解析URL获取文件名
-        parsed = urlparse(url)
-        path = unquote(parsed.path)
-        filename = path.split('/')[-1]
-        
-        # 如果没有文件名或文件名无效，使用hash
-        if not filename or '.' not in filename:
-            import hashlib
-            url_hash = hashlib.md5(url.encode()).hexdigest()[:12]
-            ext = {
-                'javascript': '.js',
-                'css': '.css',
-                'images': '.png'
-            }.get(category, '.bin')
-            filename = f"{url_hash}{ext}"
-        
-        # 清理文件名
-        filename = filename.split('?')[0]  # 移除查询参数
+        if canon is None:
+            canon = UrlCanonicalizer(keep_params=KEEP_QUERY_PARAMS, hash_len=12)
+        url = canon.canonicalize(url)
+        if url is None:
+            raise ValueError("不是可下载的http(s) URL")
+        # 规范URL对应的不冲突文件名(无文件名时使用hash)
+        filename = canon.local_name(url, save_dir, _default_ext(category))
         
         filepath = Path(save_dir) / filename
         
-        # 如果文件已存在，跳过
-        if filepath.exists():
-            print(f"  跳过(已存在): {filename}")
-            return True
-        
-        # 下载文件
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+        # 如果文件已存在且完整，跳过
+        if filepath.exists() and not force:
+            status = index.check(filepath) if index else OK
+            if status == UNINDEXED:
+                # 旧版本下载的文件,无法判断是否完整: 不登记到索引,照常跳过,--repair时重新下载
+                print(f"  跳过(已存在,未校验): {filename}")
+                return True
+            if status == OK:
+                print(f"  跳过(已存在): {filename}")
+                return True
+            print(f"  重新下载(校验失败: {status}): {filename}")
         
-        # 保存文件
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
+        content = fetch_to_file(url, filepath, index, category)
         
-        size = len(response.content)
+        size = len(content)
         print(f"  ✓ {filename} ({size:,} bytes)")
         return True
         
@@ -90,8 +143,28 @@ def extract_page_name(json_path):
     return page_name
 
 
-def download_from_json(json_file, output_prefix=None):
-    """从单个JSON文件下载资源"""
+def get_output_dir(json_path, output_prefix=None):
+    """资源文件对应的输出目录"""
+    if output_prefix:
+        return f"downloaded/{output_prefix}"
+    return f"downloaded/{extract_page_name(Path(json_path))}"
+
+
+def save_html(resources, output_dir):
+    """保存资源清单中的HTML(如果有)"""
+    if 'html' in resources and isinstance(resources['html'], dict):
+        html_path = Path(f'{output_dir}/page.html')
+        html_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(html_path, 'w', encoding='utf-8') as f:
+            f.write(resources['html'].get('original', ''))
+        print(f"✓ HTML已保存: {html_path}")
+
+
+def download_from_json(json_file, output_prefix=None, mode='download', full=False):
+    """从单个JSON文件下载资源
+    
+    mode: 'download' 正常下载; 'verify' 只校验; 'repair' 校验并重新下载有问题的文件
+    """
     json_path = Path(json_file)
     
     if not json_path.exists():
@@ -99,11 +172,7 @@ def download_from_json(json_file, output_prefix=None):
         return False
     
     # 提取页面名称用于输出目录
-    page_name = extract_page_name(json_path)
-    if output_prefix:
-        output_dir = f"downloaded/{output_prefix}"
-    else:
-        output_dir = f"downloaded/{page_name}"
+    output_dir = get_output_dir(json_path, output_prefix)
     
     print(f"\n{'='*70}")
     print(f"📄 处理资源文件: {json_path.name}")
@@ -119,21 +188,13 @@ def download_from_json(json_file, output_prefix=None):
         return False
     
     # 创建目录
-    dirs = {
-        'javascript': f'{output_dir}/js',
-        'css': f'{output_dir}/css'
-    }
+    dirs = {category: f'{output_dir}/{sub}' for category, sub in CATEGORY_DIRS.items()}
     
     for dir_path in dirs.values():
         Path(dir_path).mkdir(parents=True, exist_ok=True)
     
     # 保存HTML文件(如果有)
-    if 'html' in resources and isinstance(resources['html'], dict):
-        html_path = Path(f'{output_dir}/page.html')
-        html_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(resources['html'].get('original', ''))
-        print(f"✓ HTML已保存: {html_path}")
+    save_html(resources, output_dir)
     
     # 统计
     stats = {
@@ -144,11 +205,18 @@ def download_from_json(json_file, output_prefix=None):
     # 下载所有资源(跳过html和图片)
     print("\n开始批量下载...")
     
-    for category, urls in resources.items():
+    # 规范化URL并去重,同一资源的不同写法只下载一次
+    canon = UrlCanonicalizer(keep_params=KEEP_QUERY_PARAMS, hash_len=12)
+    index = IntegrityIndex(output_dir)
+    
+    # 按优先级处理类别: JS/CSS最先,大型媒体最后
+    categories = sorted(resources.items(), key=lambda item: priority_of(item[0]))
+    for category, urls in categories:
         # 跳过html和images
-        if category in ['html', 'images', 'other']:
+        if category in SKIP_CATEGORIES:
             continue
             
+        urls = canon.unique(urls or [])
         if not urls:
             continue
         
@@ -157,11 +225,38 @@ def download_from_json(json_file, output_prefix=None):
         
         stats[category]['total'] = len(urls)
         
-        for i, url in enumerate(urls, 1):
-            print(f"  [{i}/{len(urls)}]", end=" ")
-            if download_file(url, save_dir, category):
-                stats[category]['success'] += 1
-            time.sleep(0.3)  # 避免请求过快
+        if mode == 'download':
+            for i, url in enumerate(urls, 1):
+                print(f"  [{i}/{len(urls)}]", end=" ")
+                if download_file(url, save_dir, category, canon, index):
+                    stats[category]['success'] += 1
+                time.sleep(0.3)  # 避免请求过快
+            continue
+        
+        # 校验模式: 先stat检查,只对可疑文件并行计算摘要
+        paths = [Path(save_dir) / canon.local_name(url, save_dir, _default_ext(category))
+                 for url in urls]
+        results = index.verify(paths, full=full)
+        bad = [url for url, path in zip(urls, paths) if results[path] != OK]
+        stats[category]['success'] = len(urls) - len(bad)
+        
+        counts = {}
+        for status in results.values():
+            counts[status] = counts.get(status, 0) + 1
+        print("  校验结果: " + ", ".join(f"{k} {v}" for k, v in sorted(counts.items())))
+        for url, path in zip(urls, paths):
+            if results[path] != OK:
+                print(f"    {results[path]:10} {path.name}")
+        
+        if mode == 'repair' and bad:
+            print(f"  🔧 重新下载 {len(bad)} 个文件:")
+            for i, url in enumerate(bad, 1):
+                print(f"  [{i}/{len(bad)}]", end=" ")
+                if download_file(url, save_dir, category, canon, index, force=True):
+                    stats[category]['success'] += 1
+                time.sleep(0.3)  # 避免请求过快
+    
+    index.save()
     
     # 输出统计
     print(f"\n{'='*70}")
@@ -180,6 +275,8 @@ def download_from_json(json_file, output_prefix=None):
     
     if total_files > 0:
         print(f"  {'总计':12} {total_success:3}/{total_files:3} ({(total_success/total_files)*100:.1f}%)")
+        canon.print_stats("  ")
+        SCHEDULER.print_stats("  ")
         print(f"\n✅ 文件已保存到: {Path(output_dir).absolute()}")
         return True
     else:
@@ -187,10 +284,243 @@ def download_from_json(json_file, output_prefix=None):
         return False
 
 
+def enqueue_files(db_path, resource_files):
+    """把资源文件中的URL加入任务队列,文件名在这里确定,所有工作进程使用同一个路径
+    
+    任务按规范URL全局去重: 多个页面共用的资源只保存在第一个入队页面的目录中,
+    其他页面的目录里没有这个文件(需要每个页面都有完整副本时使用非队列模式)
+    """
+    queue = WorkQueue(db_path)
+    total_added = total_dup = 0
+    try:
+        for json_file in resource_files:
+            json_path = Path(json_file)
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    resources = json.load(f)
+            except Exception as e:
+                print(f"❌ 读取JSON失败 {json_path}: {e}")
+                continue
+            
+            output_dir = get_output_dir(json_path)
+            save_html(resources, output_dir)
+            canon = UrlCanonicalizer(keep_params=KEEP_QUERY_PARAMS, hash_len=12)
+            tasks = []
+            for category, urls in resources.items():
+                if category in SKIP_CATEGORIES:
+                    continue
+                sub = CATEGORY_DIRS.get(category, '')
+                save_dir = f'{output_dir}/{sub}' if sub else output_dir
+                for url in canon.unique(urls or []):
+                    filename = canon.local_name(url, save_dir, _default_ext(category))
+                    path = f'{sub}/{filename}' if sub else filename
+                    tasks.append((url, category, output_dir, path, priority_of(category)))
+            
+            added, dup = queue.enqueue(tasks, source=json_path.name)
+            total_added += added
+            total_dup += dup
+            print(f"  📥 {json_path.name}: 新增 {added} 个任务, 重复 {dup} 个")
+    finally:
+        queue.close()
+    print(f"✓ 共新增 {total_added} 个任务, 全局去重 {total_dup} 个")
+
+
+def run_worker(db_path, batch_size=20, lease_seconds=120, bandwidth=None, bulk_share=0.3):
+    """工作进程: 循环领取一批任务并下载,直到队列中没有待处理的任务
+    
+    bandwidth为本进程的带宽上限(字节/秒);限速器不能跨进程共享,
+    spawn方式启动的子进程也不会继承父进程的全局变量,所以由参数传入
+    """
+    global SCHEDULER
+    SCHEDULER = BandwidthScheduler(bandwidth, bulk_share)
+    worker_id = new_worker_id()
+    queue = WorkQueue(db_path, lease_seconds=lease_seconds)
+    queue.register_worker(worker_id)
+    print(f"👷 工作进程 {worker_id} 已启动")
+    
+    # 心跳线程使用自己的数据库连接
+    stop = threading.Event()
+    
+    def heartbeat():
+        hb_queue = WorkQueue(db_path, lease_seconds=lease_seconds)
+        try:
+            while not stop.wait(lease_seconds / 3):
+                hb_queue.heartbeat(worker_id)
+        finally:
+            hb_queue.close()
+    
+    hb_thread = threading.Thread(target=heartbeat, daemon=True)
+    hb_thread.start()
+    
+    # 只读的完整性索引,用于跳过已下载的完整文件
+    indexes = {}
+    try:
+        while True:
+            rows = queue.lease(worker_id, batch_size)
+            if not rows:
+                if queue.is_finished():
+                    break
+                # 其他进程还持有租约,等待它们完成或租约过期后被回收
+                time.sleep(5)
+                continue
+            
+            for row in rows:
+                url = row['url']
+                root = row['root']
+                filepath = Path(root) / row['path']
+                if root not in indexes:
+                    indexes[root] = IntegrityIndex(root)
+                try:
+                    if filepath.exists() and indexes[root].check(filepath) == OK:
+                        entry = indexes[root].entries[indexes[root].key(filepath)]
+                        queue.complete(worker_id, url, entry['size'], entry['sha256'])
+                        continue
+                    filepath.parent.mkdir(parents=True, exist_ok=True)
+                    content = fetch_to_file(url, filepath, category=row['category'])
+                    queue.complete(worker_id, url, len(content), hashlib.sha256(content).hexdigest())
+                    print(f"  ✓ [{worker_id}] {row['path']} ({len(content):,} bytes)")
+                except Exception as e:
+                    queue.fail(worker_id, url, e)
+                    print(f"  ✗ [{worker_id}] {url}: {e}")
+                time.sleep(0.3)  # 避免请求过快
+    finally:
+        stop.set()
+        queue.close()
+    print(f"👷 工作进程 {worker_id} 已结束")
+
+
+def update_indexes_from_queue(db_path, force=False):
+    """把队列中已完成任务的大小和摘要写入各输出目录的完整性索引
+    
+    工作进程不直接写索引(多个进程同时保存会互相覆盖),全部结束后统一合并;
+    多个进程/机器同时结束时由数据库选出一个进程合并,force=True时总是合并(--update-index)。
+    只记录大小与数据库一致的文件,之后--verify/--repair可以正常校验队列模式下载的文件
+    """
+    queue = WorkQueue(db_path)
+    try:
+        if not force and not queue.claim_index_update():
+            return
+        rows = queue.done_tasks()
+    finally:
+        queue.close()
+    indexes = {}
+    recorded = 0
+    for row in rows:
+        if row['sha256'] is None or row['size'] is None:
+            continue
+        root = row['root']
+        if root not in indexes:
+            indexes[root] = IntegrityIndex(root)
+        if indexes[root].record_digest(Path(root) / row['path'], row['url'], row['size'], row['sha256']):
+            recorded += 1
+    for index in indexes.values():
+        index.save()
+    if indexes:
+        print(f"✓ 完整性索引已更新: {len(indexes)} 个目录, {recorded} 个文件")
+
+
+def print_queue_status(db_path):
+    """打印任务队列进度"""
+    queue = WorkQueue(db_path)
+    try:
+        counts, duplicates, workers = queue.progress()
+    finally:
+        queue.close()
+    total = sum(counts.values())
+    done = counts['done']
+    rate = (done / total * 100) if total else 0
+    print(f"📊 队列进度: {done}/{total} ({rate:.1f}%) | 待处理 {counts['pending']} | "
+          f"下载中 {counts['leased']} | 失败 {counts['failed']} | 去重 {duplicates}")
+    now = time.time()
+    for w in workers:
+        print(f"    {w['worker_id']:40} 完成 {w['done']:5} 失败 {w['failed']:4} "
+              f"心跳 {now - w['heartbeat']:.0f}s前")
+
+
+def run_local_workers(db_path, count, bandwidth=None, bulk_share=0.3):
+    """在本机启动多个工作进程并定期打印进度,总带宽平均分给每个进程"""
+    per_worker = bandwidth / count if bandwidth else None
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(db_path,),
+                                kwargs={'bandwidth': per_worker, 'bulk_share': bulk_share})
+        for _ in range(count)
+    ]
+    for proc in processes:
+        proc.start()
+    try:
+        while any(proc.is_alive() for proc in processes):
+            time.sleep(5)
+            print_queue_status(db_path)
+    finally:
+        for proc in processes:
+            proc.join()
+    print_queue_status(db_path)
+
+
+def run_queue_mode(options, args):
+    """--queue模式: 入队、启动工作进程、查看进度"""
+    db_path = options['queue'] if options['queue'] is not True else 'download_queue.db'
+    
+    if args or 'all' in options:
+        resource_files = args or find_resource_files()
+        if not resource_files:
+            print("❌ 未找到任何 *_resources.json 文件")
+            sys.exit(1)
+        enqueue_files(db_path, resource_files)
+    
+    bandwidth = parse_rate(options.get('bandwidth'))
+    bulk_share = float(options.get('bulk-share', 0.3))
+    if 'workers' in options:
+        run_local_workers(db_path, int(options['workers']), bandwidth, bulk_share)
+        update_indexes_from_queue(db_path)
+    elif 'worker' in options:
+        run_worker(db_path, bandwidth=bandwidth, bulk_share=bulk_share)
+        update_indexes_from_queue(db_path)
+    elif 'update-index' in options:
+        update_indexes_from_queue(db_path, force=True)
+    else:
+        print_queue_status(db_path)
+
+
+def parse_options(argv):
+    """分离--key=value和--flag形式的选项和其余参数"""
+    options = {}
+    args = []
+    for arg in argv:
+        if arg.startswith('--'):
+            key, _, value = arg[2:].partition('=')
+            options[key] = value or True
+        else:
+            args.append(arg)
+    return options, args
+
+
 def main():
     """主函数"""
+    global KEEP_QUERY_PARAMS, SCHEDULER
+    
     # 解析命令行参数
-    if len(sys.argv) < 2:
+    options, args = parse_options(sys.argv[1:])
+    if 'keep-query' in options:
+        value = options['keep-query']
+        KEEP_QUERY_PARAMS = parse_keep_query(value)
+    
+    # 带宽限制
+    if 'bandwidth' in options:
+        SCHEDULER = BandwidthScheduler(parse_rate(options['bandwidth']),
+                                       float(options.get('bulk-share', 0.3)))
+    
+    # 校验/修复模式
+    mode, full = 'download', False
+    for key in ('verify', 'repair'):
+        if key in options:
+            mode, full = key, options[key] == 'full'
+    
+    if 'queue' in options:
+        run_queue_mode(options, args)
+        return
+    
+    if not args and 'all' not in options:
         # 没有参数,自动扫描webpage目录
         print("🔍 自动扫描 webpage 目录...")
         resource_files = find_resource_files()
@@ -221,7 +551,7 @@ def main():
             print(f"{'='*70}")
             success_count = 0
             for json_file in resource_files:
-                if download_from_json(json_file):
+                if download_from_json(json_file, mode=mode, full=full):
                     success_count += 1
             print(f"\n{'='*70}")
             print(f"🎉 完成! 成功处理 {success_count}/{len(resource_files)} 个文件")
@@ -231,7 +561,7 @@ def main():
             try:
                 index = int(choice) - 1
                 if 0 <= index < len(resource_files):
-                    download_from_json(resource_files[index])
+                    download_from_json(resource_files[index], mode=mode, full=full)
                 else:
                     print(f"❌ 无效的选择: {choice}")
                     sys.exit(1)
@@ -239,7 +569,7 @@ def main():
                 print(f"❌ 无效的输入: {choice}")
                 sys.exit(1)
     
-    elif sys.argv[1] == '--all':
+    elif 'all' in options:
         # 下载所有,不询问
         resource_files = find_resource_files()
         if not resource_files:
@@ -249,14 +579,14 @@ def main():
         print(f"🚀 批量下载 {len(resource_files)} 个资源文件...")
         success_count = 0
         for json_file in resource_files:
-            if download_from_json(json_file):
+            if download_from_json(json_file, mode=mode, full=full):
                 success_count += 1
         print(f"\n🎉 完成! 成功处理 {success_count}/{len(resource_files)} 个文件")
     
     else:
         # 下载指定文件
-        json_file = sys.argv[1]
-        download_from_json(json_file)
+        json_file = args[0]
+        download_from_json(json_file, mode=mode, full=full)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可复用的Chrome用户数据目录
+保留HTTP磁盘缓存和登录Cookie,重复抓取时页面资源从缓存加载,也不需要重新登录。
+同一个目录同时只能被一个Chrome使用,通过锁文件上的操作系统文件锁保护(进程异常退出时自动释放):
+  - 'snapshot': 目录被占用时复制一份临时快照使用(缓存和Cookie可读,修改不会写回)
+  - 'wait':     等待占用者释放
+使用方法:
+  python browser_profile.py reset [目录]   # 清空用户数据目录(需要重新登录)
+"""
+
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+DEFAULT_PROFILE_DIR = 'webpage/chrome_profile'
+LOCK_FILENAME = 'autoacademy.lock'
+
+# Chrome自己的单实例锁文件,快照中不能包含
+_CHROME_LOCK_FILES = ('SingletonLock', 'SingletonCookie', 'SingletonSocket', 'lockfile')
+
+
+def _lock_fd(fd):
+    """对文件加非阻塞的排他锁,已被占用时抛出OSError"""
+    if os.name == 'nt':
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _unlock_fd(fd):
+    if os.name == 'nt':
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class BrowserProfile:
+    """带锁的持久化用户数据目录"""
+
+    def __init__(self, profile_dir=DEFAULT_PROFILE_DIR, fallback='snapshot', timeout=300):
+        self.profile_dir = Path(profile_dir).absolute()
+        self.lock_file = self.profile_dir / LOCK_FILENAME
+        self.fallback = fallback
+        self.timeout = timeout
+        self.locked = False
+        self.snapshot_dir = None
+        self._fd = None
+
+    def _try_lock(self):
+        """对锁文件加排他锁,成功返回True
+
+        锁由操作系统持有(fcntl.flock / msvcrt.locking),持有进程退出或崩溃时自动释放,
+        不需要判断旧锁是否失效;锁文件本身不删除,删除后重新创建会让两个进程各锁住一个文件
+        """
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT)
+        try:
+            _lock_fd(fd)
+        except OSError:
+            os.close(fd)
+            return False
+        # 记录持有者,仅用于排查
+        info = {'pid': os.getpid(), 'host': socket.gethostname(), 'time': time.time()}
+        os.ftruncate(fd, 0)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, json.dumps(info).encode('utf-8'))
+        self._fd = fd
+        self.locked = True
+        return True
+
+    def acquire(self):
+        """获取可供Chrome使用的用户数据目录路径"""
+        if self._try_lock():
+            return str(self.profile_dir)
+
+        if self.fallback == 'snapshot':
+            # 目录被其他浏览器占用: 复制一份快照,保留缓存和Cookie
+            self.snapshot_dir = Path(tempfile.mkdtemp(prefix='chrome_profile_'))
+            shutil.copytree(
+                self.profile_dir, self.snapshot_dir, dirs_exist_ok=True,
+                ignore=shutil.ignore_patterns(LOCK_FILENAME, *_CHROME_LOCK_FILES),
+                ignore_dangling_symlinks=True
+            )
+            print(f"  用户数据目录被占用,使用快照: {self.snapshot_dir}")
+            return str(self.snapshot_dir)
+
+        start = time.time()
+        print("  等待用户数据目录被释放...")
+        while time.time() - start < self.timeout:
+            time.sleep(1)
+            if self._try_lock():
+                return str(self.profile_dir)
+        raise TimeoutError(f"等待用户数据目录超时: {self.profile_dir}")
+
+    def release(self):
+        """释放锁或删除快照(需在Chrome退出之后调用)"""
+        if self.snapshot_dir:
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+            self.snapshot_dir = None
+        if self.locked:
+            try:
+                _unlock_fd(self._fd)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+                self.locked = False
+
+    def reset(self):
+        """清空用户数据目录(缓存和登录状态),目录正在使用时报错"""
+        if not self._try_lock():
+            raise RuntimeError(f"用户数据目录正在使用,无法重置: {self.profile_dir}")
+        try:
+            for child in self.profile_dir.iterdir():
+                if child.name == LOCK_FILENAME:
+                    continue
+                if child.is_dir() and not child.is_symlink():
+                    shutil.rmtree(child)
+                else:
+                    child.unlink()
+            print(f"✓ 用户数据目录已重置: {self.profile_dir}")
+        finally:
+            self.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'reset':
+        print("使用方法: python browser_profile.py reset [目录]")
+        sys.exit(1)
+    profile_dir = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PROFILE_DIR
+    BrowserProfile(profile_dir).reset()
+
+
+if __name__ == "__main__":
+    main()
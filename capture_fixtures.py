@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+录制/回放浏览器数据,离线测试和测量资源提取代码
+  - RecordingDriver: 包装真实的WebDriver,记录性能日志、execute_script结果和find_elements得到的元素
+  - ReplayDriver:    用录制的数据代替浏览器,extract_resources_from_network/dom、save_app_data、
+                     save_dom_structure不需要Chrome就能运行
+使用方法:
+  python capture_fixtures.py info fixture.json.gz                      # 查看录制内容
+  python capture_fixtures.py bench fixture.json.gz [--repeat=20] [--scale=10]
+      --scale: 把性能日志和元素复制N份(URL加后缀),模拟更大的页面
+  python capture_fixtures.py check fixtures/sample_page.json [--update]
+      用回放数据运行四个提取函数,与录制数据中的expected比较;--update保存当前结果为expected
+"""
+
+import contextlib
+import copy
+import gzip
+import hashlib
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _script_key(script):
+    return hashlib.sha1(script.encode('utf-8')).hexdigest()
+
+
+def _is_json(value):
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class RecordingElement:
+    """包装WebElement,记录实际读取过的属性和子元素"""
+
+    def __init__(self, element, snapshot):
+        self._element = element
+        self._snapshot = snapshot
+
+    def get_attribute(self, name):
+        value = self._element.get_attribute(name)
+        self._snapshot['attrs'][name] = value
+        return value
+
+    def find_elements(self, by, value):
+        elements = self._element.find_elements(by, value)
+        snapshots = [{'attrs': {}, 'children': {}} for _ in elements]
+        self._snapshot['children'].setdefault(f"{by}:{value}", []).append(snapshots)
+        return [RecordingElement(e, s) for e, s in zip(elements, snapshots)]
+
+    def __getattr__(self, name):
+        return getattr(self._element, name)
+
+
+class RecordingDriver:
+    """包装WebDriver并记录提取资源时用到的数据,其他调用直接转发"""
+
+    def __init__(self, driver, url=None):
+        self._driver = driver
+        self._fixture = {
+            'url': url,
+            'recorded': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'performance_logs': [],
+            'scripts': {},
+            'elements': {},
+            'page_source': []
+        }
+
+    def get_log(self, log_type):
+        logs = self._driver.get_log(log_type)
+        if log_type == 'performance':
+            self._fixture['performance_logs'].append(logs)
+        return logs
+
+    def execute_script(self, script, *args):
+        args = [a._element if isinstance(a, RecordingElement) else a for a in args]
+        result = self._driver.execute_script(script, *args)
+        # 返回WebElement等无法序列化的结果不录制(例如懒加载时的滚动容器)
+        if not args and _is_json(result):
+            self._fixture['scripts'].setdefault(_script_key(script), []).append(result)
+        return result
+
+    def find_elements(self, by, value):
+        elements = self._driver.find_elements(by, value)
+        snapshots = [{'attrs': {}, 'children': {}} for _ in elements]
+        self._fixture['elements'].setdefault(f"{by}:{value}", []).append(snapshots)
+        return [RecordingElement(e, s) for e, s in zip(elements, snapshots)]
+
+    @property
+    def page_source(self):
+        source = self._driver.page_source
+        self._fixture['page_source'].append(source)
+        return source
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    def save(self, path):
+        """保存录制数据(.gz结尾时压缩)"""
+        save_fixture(self._fixture, path)
+        print(f"  ✓ 录制数据已保存: {path}")
+
+
+class FakeElement:
+    """回放时代替WebElement"""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self._calls = {}
+
+    def get_attribute(self, name):
+        return self._snapshot['attrs'].get(name)
+
+    def find_elements(self, by, value):
+        key = f"{by}:{value}"
+        calls = self._snapshot['children'].get(key, [])
+        index = self._calls.get(key, 0)
+        self._calls[key] = index + 1
+        if not calls:
+            return []
+        return [FakeElement(s) for s in calls[min(index, len(calls) - 1)]]
+
+
+class ReplayDriver:
+    """用录制数据代替Chrome的驱动对象
+
+    - get_log按录制时的调用顺序依次返回,用完后返回空列表(与真实的get_log一致)
+    - execute_script和find_elements按调用顺序返回录制结果,用完后重复最后一次
+    """
+
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.rewind()
+
+    def rewind(self):
+        self._log_index = 0
+        self._script_calls = {}
+        self._element_calls = {}
+        self._source_index = 0
+
+    def get_log(self, log_type):
+        if log_type != 'performance':
+            return []
+        logs = self.fixture['performance_logs']
+        if self._log_index >= len(logs):
+            return []
+        self._log_index += 1
+        return logs[self._log_index - 1]
+
+    def logs_remaining(self):
+        """还没有被get_log读取的录制批次数"""
+        return max(len(self.fixture['performance_logs']) - self._log_index, 0)
+
+    def execute_script(self, script, *args):
+        key = _script_key(script)
+        results = self.fixture['scripts'].get(key)
+        if not results:
+            return None
+        index = self._script_calls.get(key, 0)
+        self._script_calls[key] = index + 1
+        return copy.deepcopy(results[min(index, len(results) - 1)])
+
+    def find_elements(self, by, value):
+        key = f"{by}:{value}"
+        calls = self.fixture['elements'].get(key)
+        if not calls:
+            return []
+        index = self._element_calls.get(key, 0)
+        self._element_calls[key] = index + 1
+        return [FakeElement(s) for s in calls[min(index, len(calls) - 1)]]
+
+    @property
+    def page_source(self):
+        sources = self.fixture['page_source']
+        if not sources:
+            return ''
+        self._source_index += 1
+        return sources[min(self._source_index - 1, len(sources) - 1)]
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {}
+
+    def get(self, url):
+        pass
+
+    def quit(self):
+        pass
+
+
+def save_fixture(fixture, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == '.gz':
+        data = gzip.compress(json.dumps(fixture, ensure_ascii=False).encode('utf-8'))
+    else:
+        # 未压缩的录制数据(例如fixtures/下的示例)缩进保存,便于查看和比较差异
+        data = json.dumps(fixture, ensure_ascii=False, indent=1).encode('utf-8')
+    path.write_bytes(data)
+
+
+def load_fixture(path):
+    data = Path(path).read_bytes()
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    return json.loads(data.decode('utf-8'))
+
+
+def scale_fixture(fixture, factor):
+    """把性能日志和元素复制factor份并给URL加上后缀,模拟资源更多的大页面"""
+    if factor <= 1:
+        return fixture
+    scaled = copy.deepcopy(fixture)
+
+    def suffix(url, i):
+        if not url or not isinstance(url, str) or not url.startswith('http'):
+            return url
+        return f"{url}{'&' if '?' in url else '?'}_replay={i}"
+
+    batches = []
+    for batch in fixture['performance_logs']:
+        new_batch = []
+        for i in range(factor):
+            for log in batch:
+                message = json.loads(log['message'])
+                params = message.get('message', {}).get('params', {})
+                if 'response' in params:
+                    params['response']['url'] = suffix(params['response'].get('url'), i)
+                if 'request' in params:
+                    params['request']['url'] = suffix(params['request'].get('url'), i)
+                if 'requestId' in params:
+                    params['requestId'] = f"{params['requestId']}.{i}"
+                new_batch.append(dict(log, message=json.dumps(message)))
+        batches.append(new_batch)
+    scaled['performance_logs'] = batches
+
+    def scale_snapshots(snapshots):
+        result = []
+        for i in range(factor):
+            for snap in snapshots:
+                snap = copy.deepcopy(snap)
+                for name in ('src', 'href'):
+                    if name in snap['attrs']:
+                        snap['attrs'][name] = suffix(snap['attrs'][name], i)
+                result.append(snap)
+        return result
+
+    scaled['elements'] = {key: [scale_snapshots(call) for call in calls]
+                          for key, calls in fixture['elements'].items()}
+    return scaled
+
+
+def make_downloader(fixture, output_dir):
+    """创建使用ReplayDriver的WebsiteDownloader"""
+    from download_website import WebsiteDownloader
+    downloader = WebsiteDownloader(fixture.get('url') or 'https://example.com/', output_dir)
+    downloader.driver = ReplayDriver(fixture)
+    return downloader
+
+
+def extract_network_all(downloader):
+    """读取全部录制的get_log批次并合并结果
+
+    录制时get_log被调用多次(页面加载后、每一步懒加载、最后一次提取),
+    回放时每次调用只返回一批,所以要一直调用到批次用完
+    """
+    merged = {}
+    while True:
+        resources = downloader.extract_resources_from_network(verbose=False)
+        for category, urls in resources.items():
+            merged.setdefault(category, set()).update(urls)
+        if not downloader.driver.logs_remaining():
+            break
+    return {category: sorted(urls) for category, urls in merged.items()}
+
+
+BENCH_TARGETS = [
+    ('extract_network', extract_network_all),
+    ('extract_dom', lambda d: d.extract_resources_from_dom()),
+    ('save_app_data', lambda d: d.save_app_data()),
+    ('save_dom_structure', lambda d: d.save_dom_structure()),
+]
+
+
+def _read_json(path):
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_extractors(fixture):
+    """用回放数据依次运行四个提取函数,返回可以直接比较的结果"""
+    with tempfile.TemporaryDirectory() as tmp:
+        downloader = make_downloader(fixture, tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            network = extract_network_all(downloader)
+            dom = downloader.extract_resources_from_dom()
+            downloader.save_app_data()
+            downloader.save_dom_structure()
+        return {
+            'extract_network': {k: v for k, v in network.items() if v},
+            'blocked': dict(sorted(downloader.blocked_urls.items())),
+            'extract_dom': {k: sorted(v) for k, v in dom.items() if v},
+            'save_app_data': _read_json(Path(tmp) / 'app_data.json'),
+            'save_dom_structure': _read_json(Path(tmp) / 'dom_structure.json'),
+        }
+
+
+def check(fixture):
+    """比较提取结果和录制数据中的expected,返回是否全部一致"""
+    expected = fixture.get('expected')
+    if expected is None:
+        print("❌ 录制数据中没有expected,先用--update生成")
+        return False
+    result = run_extractors(fixture)
+    ok = True
+    for key, value in result.items():
+        if value == expected.get(key):
+            print(f"  ✓ {key}")
+        else:
+            ok = False
+            print(f"  ✗ {key}")
+            print(f"      期望: {json.dumps(expected.get(key), ensure_ascii=False)[:300]}")
+            print(f"      实际: {json.dumps(value, ensure_ascii=False)[:300]}")
+    return ok
+
+
+def bench(fixture, repeat=20):
+    """每个目标函数运行repeat次,用PhaseTimer统计耗时"""
+    from profiling import PhaseTimer
+    timer = PhaseTimer()
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(repeat):
+            for name, target in BENCH_TARGETS:
+                # 每次使用新的downloader和回放进度,避免去重状态影响结果
+                downloader = make_downloader(fixture, tmp)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    with timer.phase(name):
+                        target(downloader)
+    return timer
+
+
+def print_info(fixture):
+    logs = sum(len(batch) for batch in fixture['performance_logs'])
+    print(f"URL: {fixture.get('url')}")
+    print(f"录制时间: {fixture.get('recorded')}")
+    print(f"性能日志: {len(fixture['performance_logs'])} 次调用, {logs} 条")
+    print(f"execute_script: {len(fixture['scripts'])} 个脚本")
+    for key, calls in fixture['elements'].items():
+        print(f"find_elements {key}: {len(calls)} 次调用, 最多 {max(len(c) for c in calls) if calls else 0} 个元素")
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    options = dict(a[2:].split('=', 1) for a in sys.argv[1:] if a.startswith('--') and '=' in a)
+    if len(args) < 2 or args[0] not in ('info', 'bench', 'check'):
+        print(__doc__)
+        sys.exit(1)
+
+    fixture = load_fixture(args[1])
+    if args[0] == 'check':
+        if '--update' in sys.argv:
+            fixture['expected'] = run_extractors(fixture)
+            save_fixture(fixture, args[1])
+            print(f"✓ 已更新expected: {args[1]}")
+        elif not check(fixture):
+            sys.exit(1)
+        return
+    fixture = scale_fixture(fixture, int(options.get('scale', 1)))
+    if args[0] == 'info':
+        print_info(fixture)
+    else:
+        repeat = int(options.get('repeat', 20))
+        print(f"回放 {args[1]} (repeat={repeat}, scale={options.get('scale', 1)})")
+        timer = bench(fixture, repeat)
+        timer.summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,23 +12,112 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
-import requests
 import os
+import sys
 import time
+import queue
+import threading
+import itertools
 import json
 import re
 from pathlib import Path
-from urllib.parse import urljoin, urlparse, unquote
-import hashlib
+
+from manifest_log import ManifestLog, load_completed, compact
+from url_canon import UrlCanonicalizer, parse_keep_query
+from browser_profile import BrowserProfile, DEFAULT_PROFILE_DIR
+from profiling import PhaseTimer
+from scheduler import BandwidthScheduler, priority_of, parse_rate, BULK
+from capture_fixtures import RecordingDriver
+from warc_archive import WarcWriter
+
+
+# 按资源类型屏蔽请求时使用的URL模式(Network.setBlockedURLs支持*通配符)
+BLOCK_TYPE_PATTERNS = {
+    'image': ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.webp', '*.ico', '*.bmp'],
+    'media': ['*.mp4', '*.webm', '*.m3u8', '*.m4s', '*.ts', '*.flv', '*.mp3', '*.m4a'],
+    'font': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    'analytics': ['*google-analytics.com/*', '*googletagmanager.com/*', '*doubleclick.net/*',
+                  '*hm.baidu.com/*', '*cnzz.com/*', '*growingio.com/*', '*sensorsdata*'],
+}
+
+# 资源清单中的类别 -> 屏蔽类型
+CATEGORY_BLOCK_TYPES = {
+    'images': 'image',
+    'videos': 'media',
+    'fonts': 'font',
+}
+
+# 只需要JS/CSS时的屏蔽配置(与batch_download的下载范围相同)
+CODE_ONLY_BLOCK_TYPES = ('image', 'media', 'font', 'analytics')
+
+
+def _compile_block_patterns(patterns):
+    """把Network.setBlockedURLs的URL模式转换成正则: 只有*是通配符,?和[]按普通字符匹配"""
+    regex = '|'.join(re.escape(p).replace(r'\*', '.*') for p in patterns)
+    return re.compile(f"(?:{regex})\\Z" if patterns else r'(?!)', re.DOTALL)
 
 
 class WebsiteDownloader:
-    def __init__(self, url, output_dir="downloaded_website"):
+    def __init__(self, url, output_dir="downloaded_website", resume=False,
+                 keep_query_params='*', download_workers=4, queue_size=64,
+                 block_resource_types=(), block_url_patterns=(),
+                 profile_dir=None, profile_fallback='snapshot',
+                 profile_phases=(), profiler='cprofile',
+                 bandwidth=None, bulk_share=0.3, record_fixture=None,
+                 output_format='files', warc_dir=None):
         self.url = url
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
-        self.downloaded_urls = set()
+        # 已下载的规范URL -> 相对路径
+        self.downloaded_urls = {}
+        # URL规范化与去重,keep_query_params见url_canon.canonicalize_url
+        self.canon = UrlCanonicalizer(base=url, keep_params=keep_query_params)
         self.driver = None
+        # 流式清单: 每完成一个资源追加一行,结束时压缩成manifest.json
+        self.resume = resume
+        self.manifest_log_file = self.output_dir / 'manifest.jsonl'
+        self.manifest_log = None
+        self.completed = {}
+        self.lazy_load_passes = []
+        # 懒加载统计: 已读取的Resource Timing条目数和出现过的规范URL
+        self._resource_offset = 0
+        self._seen_resource_urls = set()
+        # 浏览与下载并行: 下载线程数和有界队列长度
+        self.download_workers = download_workers
+        self.queue_size = queue_size
+        self.download_queue = None
+        self._workers = []
+        self._bulk_slots = None
+        # 出错或中断时设置,下载线程丢弃队列中剩余的资源
+        self._cancel_downloads = threading.Event()
+        # 浏览器端屏蔽的请求: 资源类型见BLOCK_TYPE_PATTERNS,URL模式支持*通配符
+        self.block_resource_types = set(block_resource_types)
+        self.block_url_patterns = list(block_url_patterns)
+        for res_type in self.block_resource_types:
+            for pattern in BLOCK_TYPE_PATTERNS.get(res_type, []):
+                self.block_url_patterns.append(pattern)
+                # 带查询参数的URL
+                if not pattern.endswith('/*'):
+                    self.block_url_patterns.append(pattern + '?*')
+        self._block_regex = None
+        self.blocked_urls = {}
+        self._network_requests = {}
+        # 持久化用户数据目录(磁盘缓存+登录Cookie),None时使用临时目录
+        self.profile = BrowserProfile(profile_dir, fallback=profile_fallback) if profile_dir else None
+        # 分阶段计时,profile_phases中的阶段用cProfile或采样分析器(profiler='sampling')分析
+        self.profile_phases = profile_phases
+        self.profiler = profiler
+        self.timer = PhaseTimer(self.output_dir, profile_phases, profiler)
+        # 按优先级下载: JS/CSS > 字体/图片 > 大型媒体,大型媒体最多占用bulk_share的带宽(字节/秒)
+        self.scheduler = BandwidthScheduler(bandwidth, bulk_share)
+        self._queue_seq = itertools.count()
+        # 录制性能日志和DOM数据,之后可用capture_fixtures.py离线回放
+        self.record_fixture = record_fixture
+        # 输出格式: 'files' 目录结构, 'warc' 压缩WARC+CDXJ索引, 'both' 两者都写
+        # 多个页面可以共用同一个warc_dir
+        self.output_format = output_format
+        self.warc_dir = Path(warc_dir) if warc_dir else self.output_dir / 'warc'
+        self.warc = None
         
     def setup_driver(self):
         """设置Chrome驱动"""
@@ -49,6 +138,22 @@ class WebsiteDownloader:
         # 启用性能日志
         chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
         
+        # 复用用户数据目录: 页面资源从磁盘缓存加载,登录状态保留
+        if self.profile:
+            user_data_dir = self.profile.acquire()
+            chrome_options.add_argument(f'--user-data-dir={user_data_dir}')
+            chrome_options.add_argument('--profile-directory=Default')
+            chrome_options.add_argument('--disk-cache-size=1073741824')
+            chrome_options.add_argument('--no-first-run')
+            chrome_options.add_argument('--no-default-browser-check')
+            chrome_options.add_argument('--hide-crash-restore-bubble')
+            # 图片只通过Network.setBlockedURLs屏蔽: prefs会写入用户数据目录的Preferences,
+            # 之前的版本用它关闭过图片,这里恢复为允许,避免影响之后的正常抓取
+            chrome_options.add_experimental_option('prefs', {
+                'profile.managed_default_content_settings.images': 1
+            })
+            print(f"  使用用户数据目录: {user_data_dir}")
+        
         try:
             self.driver = webdriver.Chrome(
                 service=Service(ChromeDriverManager().install()),
@@ -60,9 +165,18 @@ class WebsiteDownloader:
                 "userAgent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
             })
             
+            # 屏蔽不需要的请求(图片、视频分片、统计脚本、字体等)
+            if self.block_url_patterns:
+                self.driver.execute_cdp_cmd('Network.enable', {})
+                self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.block_url_patterns})
+                print(f"✓ 已屏蔽 {len(self.block_url_patterns)} 个URL模式")
+            
             # 隐藏webdriver特征
             self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
             
+            if self.record_fixture:
+                self.driver = RecordingDriver(self.driver, self.url)
+            
             print("✓ Chrome浏览器已启动")
         except Exception as e:
             print(f"错误: 无法启动Chrome浏览器: {e}")
@@ -71,21 +185,15 @@ class WebsiteDownloader:
     
     def download_resource(self, url, resource_type='other'):
         """下载单个资源文件"""
-        if url in self.downloaded_urls:
+        original_url = url
+        # 规范化URL: 解析相对路径,去掉fragment和不需要的查询参数
+        url = self.canon.canonicalize(url)
+        if url is None:
             return None
+        if url in self.downloaded_urls:
+            return self.downloaded_urls[url]
         
         try:
-            # 清理URL
-            url = url.split('?')[0] if '?' in url else url
-            url = url.split('#')[0] if '#' in url else url
-            
-            if not url.startswith('http'):
-                url = urljoin(self.url, url)
-            
-            # 生成本地文件路径
-            parsed = urlparse(url)
-            path_parts = parsed.path.strip('/').split('/')
-            
             # 确定文件类型和目录
             if resource_type == 'javascript':
                 save_dir = self.output_dir / 'js'
@@ -98,41 +206,40 @@ class WebsiteDownloader:
             else:
                 save_dir = self.output_dir / 'other'
             
-            save_dir.mkdir(parents=True, exist_ok=True)
-            
-            # 生成文件名
-            if path_parts:
-                filename = path_parts[-1]
-                if not filename or '.' not in filename:
-                    # 使用URL的hash作为文件名
-                    url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-                    ext = self._get_extension(resource_type)
-                    filename = f"{url_hash}{ext}"
-            else:
-                url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-                ext = self._get_extension(resource_type)
-                filename = f"{url_hash}{ext}"
-            
+            # 生成不冲突的文件名
+            filename = self.canon.local_name(url, save_dir, self._get_extension(resource_type))
             filepath = save_dir / filename
             
-            # 下载文件
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
+            # 下载文件(按优先级类别限速)
+            content, response = self.scheduler.fetch(url, resource_type)
+            
+            record = {}
+            rel_path = None
+            if self.warc:
+                # 写入WARC归档
+                entry = self.warc.write_response(url, response.status_code, response.reason,
+                                                 response.headers, content, category=resource_type)
+                record['warc'] = {k: entry[k] for k in ('filename', 'offset', 'length')}
             
-            # 保存文件
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            if not self.warc or self.output_format != 'warc':
+                # 保存文件
+                save_dir.mkdir(parents=True, exist_ok=True)
+                with open(filepath, 'wb') as f:
+                    f.write(content)
+                rel_path = str(filepath.relative_to(self.output_dir))
             
-            self.downloaded_urls.add(url)
+            self.downloaded_urls[url] = rel_path or f"warc:{record['warc']['filename']}"
             print(f"  ✓ 已下载: {resource_type:12} - {filename}")
             
-            return str(filepath.relative_to(self.output_dir))
+            if self.manifest_log:
+                self.manifest_log.resource(original_url, resource_type, 'ok',
+                                           path=rel_path, size=len(content), **record)
+            return self.downloaded_urls[url]
             
         except Exception as e:
             print(f"  ✗ 下载失败 [{url}]: {e}")
+            if self.manifest_log:
+                self.manifest_log.resource(original_url, resource_type, 'failed', error=e)
             return None
     
     def _get_extension(self, resource_type):
@@ -230,9 +337,13 @@ class WebsiteDownloader:
         
         return resources
     
-    def extract_resources_from_network(self):
-        """从Chrome性能日志中提取网络请求的资源"""
-        print("\n正在从网络日志中提取资源...")
+    def extract_resources_from_network(self, verbose=True):
+        """从Chrome性能日志中提取网络请求的资源
+        
+        get_log只返回上次调用之后的新日志,可以在滚动过程中多次调用
+        """
+        if verbose:
+            print("\n正在从网络日志中提取资源...")
         resources = {
             'javascript': [],
             'css': [],
@@ -249,6 +360,22 @@ class WebsiteDownloader:
                 message = json.loads(log['message'])
                 method = message.get('message', {}).get('method', '')
                 
+                # 记录请求,用于找出被屏蔽的URL
+                if method == 'Network.requestWillBeSent':
+                    params = message['message']['params']
+                    self._network_requests[params['requestId']] = (
+                        params['request'].get('url', ''), params.get('type', '')
+                    )
+                    continue
+                if method == 'Network.loadingFailed':
+                    params = message['message']['params']
+                    if params.get('blockedReason') and params['requestId'] in self._network_requests:
+                        url, req_type = self._network_requests[params['requestId']]
+                        category = {'Image': 'images', 'Media': 'videos', 'Font': 'fonts',
+                                    'Script': 'javascript', 'Stylesheet': 'css'}.get(req_type, 'other')
+                        self._record_blocked(category, [url])
+                    continue
+                
                 # 只处理网络响应
                 if method == 'Network.responseReceived':
                     response = message['message']['params']['response']
@@ -271,12 +398,13 @@ class WebsiteDownloader:
             for key in resources:
                 resources[key] = list(set(resources[key]))
             
-            print(f"  从网络日志中发现:")
-            print(f"    JavaScript: {len(resources['javascript'])} 个")
-            print(f"    CSS: {len(resources['css'])} 个")
-            print(f"    图片: {len(resources['images'])} 个")
-            print(f"    字体: {len(resources['fonts'])} 个")
-            print(f"    其他: {len(resources['other'])} 个")
+            if verbose:
+                print(f"  从网络日志中发现:")
+                print(f"    JavaScript: {len(resources['javascript'])} 个")
+                print(f"    CSS: {len(resources['css'])} 个")
+                print(f"    图片: {len(resources['images'])} 个")
+                print(f"    字体: {len(resources['fonts'])} 个")
+                print(f"    其他: {len(resources['other'])} 个")
             
         except Exception as e:
             print(f"  错误: {e}")
@@ -306,6 +434,9 @@ class WebsiteDownloader:
             with open(rendered_file, 'w', encoding='utf-8') as f:
                 f.write(rendered_html)
             print(f"  ✓ 渲染后的HTML已保存: {rendered_file}")
+            if self.warc:
+                self.warc.write_resource(self.url, rendered_html.encode('utf-8'),
+                                         'text/html; charset=utf-8', category='page')
             
             # 保存body内容（主要的应用内容）
             body_html = self.driver.execute_script("return document.body.outerHTML")
@@ -322,7 +453,8 @@ class WebsiteDownloader:
             print(f"  ✓ 页面文本已保存: {text_file}")
             
             # 保存Vue/React应用的数据（如果存在）
-            self.save_app_data()
+            with self.timer.phase('save_app_data'):
+                self.save_app_data()
             
         except Exception as e:
             print(f"  错误: {e}")
@@ -425,102 +557,332 @@ class WebsiteDownloader:
         except Exception as e:
             print(f"    提取应用数据时出错: {e}")
     
+    def _resource_count(self):
+        """已发起的资源请求数(Resource Timing,不消耗性能日志)"""
+        return self.driver.execute_script(
+            "return performance.getEntriesByType('resource').length"
+        )
+    
+    def _wait_for_network_idle(self, quiet_time=0.3, timeout=5):
+        """等待新发起的请求稳定下来: 请求数在quiet_time内不再增加即返回"""
+        start = time.time()
+        last_count = self._resource_count()
+        last_change = start
+        while time.time() - start < timeout:
+            time.sleep(0.1)
+            count = self._resource_count()
+            if count != last_count:
+                last_count = count
+                last_change = time.time()
+            elif time.time() - last_change >= quiet_time:
+                break
+        return last_count
+    
+    def _new_resource_urls(self):
+        """上次调用之后新请求的资源中,第一次出现的规范URL数量
+        
+        轮询接口、心跳/进度上报和重复请求不算新资源
+        """
+        names = self.driver.execute_script(
+            "return performance.getEntriesByType('resource').slice(arguments[0]).map(e => e.name)",
+            self._resource_offset
+        ) or []
+        self._resource_offset += len(names)
+        new_count = 0
+        for name in names:
+            canon = self.canon.canonicalize(name)
+            if canon and canon not in self._seen_resource_urls:
+                self._seen_resource_urls.add(canon)
+                new_count += 1
+        return new_count
+    
+    def trigger_lazy_load(self, max_passes=5, quiet_time=0.3, timeout=5, on_step=None,
+                          max_steps=200, max_height=200000):
+        """逐屏滚动窗口和内部滚动容器以触发懒加载
+        
+        每一步只等待新发起的请求稳定,某一轮没有请求新的URL时提前结束。
+        on_step在每一步请求稳定后调用(用于增量收集网络资源)。
+        无限滚动的页面每一轮中窗口最多滚动max_steps屏或max_height像素,每个容器最多滚动max_steps屏。
+        返回每一轮新发现的资源(不重复的URL)数量列表。
+        """
+        print("滚动页面以加载所有资源...")
+        # 默认缓冲区只有250条,扩大后才能统计长页面的全部请求
+        self.driver.execute_script("performance.setResourceTimingBufferSize(100000)")
+        # 页面加载时已经请求过的URL不计入第一轮
+        self._resource_offset = 0
+        self._seen_resource_urls = set()
+        self._new_resource_urls()
+        
+        passes = []
+        for pass_no in range(1, max_passes + 1):
+            # 逐屏滚动窗口,让视口内才加载的内容进入视口
+            page_height = self.driver.execute_script("return document.documentElement.scrollHeight")
+            step = self.driver.execute_script("return Math.max(window.innerHeight * 0.9, 200)")
+            y = 0
+            steps = 0
+            while y < page_height:
+                if steps >= max_steps or y >= max_height:
+                    print(f"  页面持续变长(无限滚动),本轮停止在 {y:.0f}px")
+                    break
+                steps += 1
+                y += step
+                self.driver.execute_script("window.scrollTo(0, arguments[0]);", y)
+                self._wait_for_network_idle(quiet_time, timeout)
+                if on_step:
+                    on_step()
+                # 无限滚动页面会在滚动过程中变长
+                page_height = self.driver.execute_script("return document.documentElement.scrollHeight")
+            
+            # 查找并逐屏滚动内部可滚动容器
+            containers = self.driver.execute_script("""
+                const result = [];
+                document.querySelectorAll('*').forEach(el => {
+                    if (el.scrollHeight > el.clientHeight + 10) {
+                        const overflow = getComputedStyle(el).overflowY;
+                        if (overflow === 'auto' || overflow === 'scroll' || overflow === 'overlay') {
+                            result.push(el);
+                        }
+                    }
+                });
+                return result;
+            """) or []
+            for container in containers:
+                try:
+                    steps = 0
+                    while steps < max_steps and self.driver.execute_script("""
+                        const el = arguments[0];
+                        const before = el.scrollTop;
+                        el.scrollTop = before + el.clientHeight * 0.9;
+                        return el.scrollTop > before;
+                    """, container):
+                        steps += 1
+                        self._wait_for_network_idle(quiet_time, timeout)
+                        if on_step:
+                            on_step()
+                except Exception:
+                    # 容器在滚动过程中被移除
+                    continue
+            
+            # 回到顶部
+            self.driver.execute_script("window.scrollTo(0, 0);")
+            self._wait_for_network_idle(quiet_time, timeout)
+            
+            new_count = self._new_resource_urls()
+            passes.append(new_count)
+            print(f"  第{pass_no}轮: 新发现 {new_count} 个资源 (滚动容器 {len(containers)} 个)")
+            if new_count == 0:
+                break
+        
+        self.lazy_load_passes = passes
+        if self.manifest_log:
+            self.manifest_log.append({'type': 'lazy_load', 'passes': passes})
+        return passes
+    
+    def _start_download_workers(self):
+        """启动下载线程,从有界优先级队列中取资源下载"""
+        self.download_queue = queue.PriorityQueue(maxsize=self.queue_size)
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self._cancel_downloads.clear()
+        # 大文件最多占用download_workers-1个线程,至少留一个线程给之后发现的JS/CSS
+        self._bulk_slots = threading.Semaphore(self.download_workers - 1) if self.download_workers > 1 else None
+        self._workers = []
+        for i in range(self.download_workers):
+            worker = threading.Thread(target=self._download_worker, name=f"download-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+    
+    def _download_worker(self):
+        while True:
+            item = self.download_queue.get()
+            try:
+                _, _, res_type, url = item
+                if res_type is None:
+                    return
+                if self._cancel_downloads.is_set():
+                    continue
+                # 续传: 上次已下载且文件仍在
+                if self._is_completed(url):
+                    ok = True
+                elif self._bulk_slots and priority_of(res_type) == BULK:
+                    if not self._bulk_slots.acquire(timeout=0.2):
+                        # 其他线程都在下载大文件: 放回队列,这个线程继续处理优先级更高的资源
+                        self.download_queue.put(item)
+                        continue
+                    try:
+                        with self.timer.phase('download'):
+                            ok = self.download_resource(url, res_type)
+                    finally:
+                        self._bulk_slots.release()
+                else:
+                    with self.timer.phase('download'):
+                        ok = self.download_resource(url, res_type)
+                with self._stats_lock:
+                    stat = self.stats.setdefault(res_type, {'total': 0, 'success': 0})
+                    if ok:
+                        stat['success'] += 1
+            finally:
+                self.download_queue.task_done()
+    
+    def _is_blocked(self, res_type, url):
+        """资源是否在屏蔽范围内(按类别或URL模式)"""
+        if CATEGORY_BLOCK_TYPES.get(res_type) in self.block_resource_types:
+            return True
+        if self._block_regex is None:
+            self._block_regex = _compile_block_patterns(self.block_url_patterns)
+        return bool(self._block_regex.match(url))
+    
+    def _record_blocked(self, res_type, urls):
+        """记录被屏蔽的URL,写入清单以便之后需要时再下载"""
+        new_urls = []
+        for url in urls:
+            canon = self.canon.canonicalize(url)
+            if canon and canon not in self.blocked_urls:
+                self.blocked_urls[canon] = res_type
+                new_urls.append(canon)
+        if new_urls and self.manifest_log:
+            self.manifest_log.append({'type': 'blocked', 'category': res_type, 'urls': new_urls})
+    
+    def _enqueue_resources(self, resources):
+        """把新发现的资源放入下载队列(按规范URL去重),队列满时阻塞浏览器端"""
+        for res_type, urls in resources.items():
+            if self.block_url_patterns or self.block_resource_types:
+                # 屏蔽范围内的资源(例如DOM中的图片)只记录不下载
+                blocked = [url for url in urls if self._is_blocked(res_type, url)]
+                if blocked:
+                    self._record_blocked(res_type, blocked)
+                    blocked = set(blocked)
+                    urls = [url for url in urls if url not in blocked]
+            new_urls = self.canon.unique(urls)
+            if not new_urls:
+                continue
+            self.manifest_log.discovered(res_type, new_urls)
+            with self._stats_lock:
+                self.stats.setdefault(res_type, {'total': 0, 'success': 0})['total'] += len(new_urls)
+            # 优先级相同时按发现顺序下载
+            priority = priority_of(res_type)
+            for url in new_urls:
+                self.download_queue.put((priority, next(self._queue_seq), res_type, url))
+    
+    def _collect_network(self):
+        """增量读取性能日志(get_log会清空已读取的日志),新资源立即开始下载"""
+        with self.timer.phase('extract_network'):
+            resources = self.extract_resources_from_network(verbose=False)
+        self._enqueue_resources(resources)
+    
+    def _stop_download_workers(self, cancel=False):
+        """等待队列中的下载全部完成并结束下载线程
+        
+        cancel=True时不再下载队列中剩余的资源,只等待正在进行的下载结束
+        """
+        if cancel:
+            self._cancel_downloads.set()
+        # 结束标记排在所有资源之后
+        for _ in self._workers:
+            self.download_queue.put((99, next(self._queue_seq), None, None))
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+    
     def download_all(self):
-        """下载所有资源"""
+        """下载所有资源
+        
+        浏览器线程负责加载、滚动和提取资源,发现的资源立即进入有界队列,
+        由下载线程并行下载,页面耗时接近max(浏览, 下载)而不是两者之和
+        """
         print(f"\n{'='*60}")
         print(f"开始下载网站: {self.url}")
         print(f"保存目录: {self.output_dir.absolute()}")
         print(f"{'='*60}")
         
+        # 打开流式清单(续传时保留已有记录)
+        if not self.resume and self.manifest_log_file.exists():
+            self.manifest_log_file.unlink()
+        self.completed = load_completed(self.manifest_log_file) if self.resume else {}
+        if self.completed:
+            print(f"续传: 清单中已有 {len(self.completed)} 个已完成的资源")
+        self.manifest_log = ManifestLog(self.manifest_log_file).open()
+        self.manifest_log.page(self.url)
+        self.timer = PhaseTimer(self.output_dir, self.profile_phases, self.profiler)
+        completed = False
+        
         try:
+            # WARC归档输出
+            if self.output_format in ('warc', 'both'):
+                self.warc = WarcWriter(self.warc_dir)
+                print(f"WARC归档目录: {self.warc_dir.absolute()}")
+            
             # 设置浏览器
-            self.setup_driver()
+            with self.timer.phase('setup_driver'):
+                self.setup_driver()
+            
+            # 启动下载线程,发现资源后立即开始下载
+            self._start_download_workers()
             
             # 访问网页
             print(f"\n正在加载页面: {self.url}")
-            self.driver.get(self.url)
+            with self.timer.phase('navigation'):
+                self.driver.get(self.url)
             
             # 等待页面加载
             print("等待页面完全加载...")
-            time.sleep(5)  # 给JavaScript时间执行
+            with self.timer.phase('wait'):
+                time.sleep(5)  # 给JavaScript时间执行
+                
+                # 等待特定元素（可以根据实际页面调整）
+                try:
+                    WebDriverWait(self.driver, 10).until(
+                        EC.presence_of_element_located((By.TAG_NAME, "body"))
+                    )
+                except:
+                    pass
+            self._collect_network()
             
-            # 等待特定元素（可以根据实际页面调整）
-            try:
-                WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-            except:
-                pass
+            # 滚动页面和内部滚动容器以触发懒加载,每一步都把新请求交给下载线程
+            with self.timer.phase('scroll'):
+                self.trigger_lazy_load(on_step=self._collect_network)
             
-            # 滚动页面以触发懒加载
-            print("滚动页面以加载所有资源...")
-            last_height = self.driver.execute_script("return document.body.scrollHeight")
-            while True:
-                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
-                new_height = self.driver.execute_script("return document.body.scrollHeight")
-                if new_height == last_height:
-                    break
-                last_height = new_height
+            # 提取资源
+            with self.timer.phase('extract_dom'):
+                dom_resources = self.extract_resources_from_dom()
+            self._enqueue_resources(dom_resources)
+            with self.timer.phase('extract_network'):
+                network_resources = self.extract_resources_from_network()
+            self._enqueue_resources(network_resources)
             
-            # 回到顶部
-            self.driver.execute_script("window.scrollTo(0, 0);")
-            time.sleep(2)
+            # 下载线程工作的同时保存HTML和页面结构
+            with self.timer.phase('save_page_html'):
+                self.save_page_html()
+            with self.timer.phase('save_dom_structure'):
+                self.save_dom_structure()
             
-            # 提取资源
-            dom_resources = self.extract_resources_from_dom()
-            network_resources = self.extract_resources_from_network()
-            
-            # 合并资源列表
-            all_resources = {}
-            for res_type in ['javascript', 'css', 'images', 'fonts', 'videos']:
-                all_resources[res_type] = list(set(
-                    dom_resources.get(res_type, []) + 
-                    network_resources.get(res_type, [])
-                ))
-            
-            # 添加其他网络资源
-            if 'other' in network_resources:
-                all_resources['other'] = network_resources['other']
-            
-            # 下载所有资源
+            # 等待剩余下载完成
             print(f"\n{'='*60}")
-            print("开始下载资源文件...")
+            print(f"等待剩余下载完成 (队列中 {self.download_queue.qsize()} 个)...")
             print(f"{'='*60}")
+            with self.timer.phase('download_drain'):
+                self._stop_download_workers()
             
-            stats = {}
-            for res_type, urls in all_resources.items():
-                if urls:
-                    print(f"\n下载 {res_type} ({len(urls)} 个):")
-                    success = 0
-                    for url in urls:
-                        if self.download_resource(url, res_type):
-                            success += 1
-                    stats[res_type] = {'total': len(urls), 'success': success}
-            
-            # 保存HTML和页面结构
-            self.save_page_html()
-            self.save_dom_structure()
-            
-            # 保存资源清单
+            # 保存资源清单(由流式清单压缩生成)
             manifest_file = self.output_dir / 'manifest.json'
-            manifest = {
-                'url': self.url,
-                'download_time': time.strftime('%Y-%m-%d %H:%M:%S'),
-                'resources': all_resources,
-                'statistics': stats
-            }
-            
-            with open(manifest_file, 'w', encoding='utf-8') as f:
-                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            self.manifest_log.close()
+            self.manifest_log = None
+            compact(self.manifest_log_file, manifest_file)
             
             print(f"\n{'='*60}")
             print("下载完成！统计信息:")
             print(f"{'='*60}")
-            for res_type, stat in stats.items():
-                print(f"{res_type:12}: {stat['success']}/{stat['total']} 成功")
+            for res_type, stat in self.stats.items():
+                if stat['total']:
+                    print(f"{res_type:12}: {stat['success']}/{stat['total']} 成功")
+            self.canon.print_stats()
+            self.scheduler.print_stats()
+            if self.blocked_urls:
+                print(f"已屏蔽 {len(self.blocked_urls)} 个请求(已记录在清单的blocked中)")
+            
             print(f"\n所有文件已保存到: {self.output_dir.absolute()}")
             print(f"资源清单: {manifest_file}")
+            completed = True
             
         except Exception as e:
             print(f"\n错误: {e}")
@@ -528,9 +890,53 @@ class WebsiteDownloader:
             traceback.print_exc()
         
         finally:
+            if self._workers:
+                # 出错或Ctrl+C时先结束下载线程,之后才能关闭WARC和清单
+                self._stop_download_workers(cancel=True)
+            try:
+                # 各阶段耗时,出错或中断时也保存,completed区分是否完整运行
+                self.timer.summary()
+                self.timer.save(url=self.url, lazy_load_passes=self.lazy_load_passes, completed=completed)
+                print(f"耗时报告: {self.output_dir / 'timing.json'}")
+            except Exception as e:
+                print(f"保存耗时报告失败: {e}")
+            if self.warc:
+                # 关闭WARC文件并排序索引
+                self.warc.close()
+                self.warc = None
+            if self.manifest_log:
+                # 中断时也生成manifest.json,记录已完成的部分
+                self.manifest_log.close()
+                compact(self.manifest_log_file, self.output_dir / 'manifest.json')
             if self.driver:
+                if self.record_fixture:
+                    # 保存失败也要关闭浏览器并释放用户数据目录
+                    try:
+                        self.driver.save(self.record_fixture)
+                    except Exception as e:
+                        print(f"  保存录制数据失败: {e}")
                 print("\n关闭浏览器...")
                 self.driver.quit()
+            if self.profile:
+                # Chrome退出、缓存写回之后再释放用户数据目录
+                self.profile.release()
+
+    def _is_completed(self, url):
+        """续传时判断资源是否已下载完成"""
+        record = self.completed.get(url)
+        if not record:
+            return False
+        if record.get('warc') and not record.get('path'):
+            # 只写入了WARC归档
+            self.downloaded_urls[url] = f"warc:{record['warc']['filename']}"
+            return True
+        path = record.get('path')
+        if path and (self.output_dir / path).exists():
+            self.downloaded_urls[url] = path
+            filepath = self.output_dir / path
+            self.canon.reserve(url, filepath.parent, filepath.name)
+            return True
+        return False
 
 
     def save_dom_structure(self):
@@ -635,6 +1041,45 @@ def main():
     # 配置要下载的网站
     url = "https://academy.famsungroup.com/kng/#/video/play?kngId=3c510a2e-b33e-42fb-8191-c61d8ea0ddfd"
     output_dir = "webpage/downloaded_site_full"
+    # --resume: 根据上次的manifest.jsonl跳过已下载的资源
+    resume = '--resume' in sys.argv
+    # --code-only: 只抓取JS/CSS,浏览器不加载图片、视频、字体和统计脚本
+    block_types = CODE_ONLY_BLOCK_TYPES if '--code-only' in sys.argv else ()
+    # --profile: 复用用户数据目录(磁盘缓存和登录状态),第一次使用时在打开的浏览器中登录
+    # --reset-profile: 清空用户数据目录后再开始
+    # --profile-phase=scroll,extract_dom: 对指定阶段做性能分析; --profiler=sampling: 使用采样分析器
+    profile_phases = ()
+    profiler = 'cprofile'
+    for arg in sys.argv[1:]:
+        if arg.startswith('--profile-phase='):
+            profile_phases = tuple(p for p in arg.split('=', 1)[1].split(',') if p)
+        elif arg.startswith('--profiler='):
+            profiler = arg.split('=', 1)[1]
+    # --record=fixture.json.gz: 录制浏览器数据,用于capture_fixtures.py离线回放和性能测试
+    record_fixture = None
+    for arg in sys.argv[1:]:
+        if arg.startswith('--record='):
+            record_fixture = arg.split('=', 1)[1]
+    # --warc: 资源写入压缩WARC和CDXJ索引(不再保存为单独的文件), --warc=both: 两者都写
+    output_format = 'files'
+    for arg in sys.argv[1:]:
+        if arg == '--warc':
+            output_format = 'warc'
+        elif arg.startswith('--warc='):
+            output_format = arg.split('=', 1)[1]
+    # --bandwidth=2M: 总带宽上限,大型媒体最多占用其中30%
+    bandwidth = None
+    for arg in sys.argv[1:]:
+        if arg.startswith('--bandwidth='):
+            bandwidth = parse_rate(arg.split('=', 1)[1])
+    # --keep-query=v,id: 只保留指定的查询参数; 默认保留缓存破坏参数以外的全部参数, --keep-query=none 全部去掉
+    keep_query_params = '*'
+    for arg in sys.argv[1:]:
+        if arg.startswith('--keep-query='):
+            keep_query_params = parse_keep_query(arg.split('=', 1)[1])
+    profile_dir = DEFAULT_PROFILE_DIR if '--profile' in sys.argv or '--reset-profile' in sys.argv else None
+    if '--reset-profile' in sys.argv:
+        BrowserProfile(profile_dir).reset()
     
     print("""
 ╔══════════════════════════════════════════════════════════════╗
@@ -660,7 +1105,11 @@ def main():
     
     input("按回车键开始下载...")
     
-    downloader = WebsiteDownloader(url, output_dir)
+    downloader = WebsiteDownloader(url, output_dir, resume=resume, block_resource_types=block_types,
+                                   profile_dir=profile_dir, profile_phases=profile_phases,
+                                   profiler=profiler, bandwidth=bandwidth,
+                                   keep_query_params=keep_query_params,
+                                   record_fixture=record_fixture, output_format=output_format)
     downloader.download_all()
 
 
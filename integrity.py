@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载文件完整性索引
+为每个文件记录大小、修改时间和SHA-256摘要:
+  - 大小和修改时间都没变的文件只做一次stat检查
+  - 只有可疑的文件才重新计算摘要,并且多线程并行计算
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+INDEX_FILENAME = '.integrity.json'
+
+# 校验结果
+OK = 'ok'
+MISSING = 'missing'        # 文件不存在
+CORRUPT = 'corrupt'        # 大小或摘要与索引不一致
+UNINDEXED = 'unindexed'    # 文件存在但索引中没有记录(旧版本下载或中断)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """计算文件的SHA-256(大块读取时hashlib会释放GIL,可以多线程并行)"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class IntegrityIndex:
+    """保存在输出目录下的.integrity.json"""
+
+    def __init__(self, root, workers=None):
+        self.root = Path(root)
+        self.path = self.root / INDEX_FILENAME
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 2)
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self.entries = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"  ⚠️  完整性索引损坏,将重新建立: {e}")
+                self.entries = {}
+
+    def key(self, filepath):
+        return Path(os.path.relpath(filepath, self.root)).as_posix()
+
+    def record(self, filepath, url, data=None):
+        """记录刚下载的文件,data为写入的内容时不必再读一遍文件"""
+        filepath = Path(filepath)
+        st = filepath.stat()
+        digest = hashlib.sha256(data).hexdigest() if data is not None else file_digest(filepath)
+        with self._lock:
+            self.entries[self.key(filepath)] = {
+                'url': url,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'sha256': digest
+            }
+            self._dirty += 1
+            dirty = self._dirty
+        # 定期保存,中断时索引也基本是最新的
+        if dirty >= 50:
+            self.save()
+
+    def record_digest(self, filepath, url, size, digest):
+        """记录已知大小和摘要的文件(例如任务队列中其他进程下载的结果),大小不一致时不记录"""
+        filepath = Path(filepath)
+        try:
+            st = filepath.stat()
+        except FileNotFoundError:
+            return False
+        if st.st_size != size:
+            return False
+        with self._lock:
+            self.entries[self.key(filepath)] = {
+                'url': url,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'sha256': digest
+            }
+            self._dirty += 1
+        return True
+
+    def _stat_check(self, filepath):
+        """只用stat判断: 返回(状态, 是否需要重新计算摘要)"""
+        entry = self.entries.get(self.key(filepath))
+        try:
+            st = Path(filepath).stat()
+        except FileNotFoundError:
+            return MISSING, False
+        if entry is None:
+            return UNINDEXED, False
+        if st.st_size != entry['size']:
+            # 大小不同一定是截断或损坏,不需要计算摘要
+            return CORRUPT, False
+        if st.st_mtime_ns != entry['mtime_ns']:
+            return None, True
+        return OK, False
+
+    def _rehash(self, filepath):
+        """重新计算摘要,一致时更新索引中的修改时间"""
+        key = self.key(filepath)
+        try:
+            digest = file_digest(filepath)
+            st = Path(filepath).stat()
+        except FileNotFoundError:
+            return MISSING
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or digest != entry['sha256']:
+                return CORRUPT
+            entry['mtime_ns'] = st.st_mtime_ns
+            self._dirty += 1
+        return OK
+
+    def check(self, filepath):
+        """校验单个文件"""
+        status, need_hash = self._stat_check(filepath)
+        if need_hash:
+            status = self._rehash(filepath)
+        return status
+
+    def verify(self, filepaths, full=False):
+        """批量校验,返回{文件路径: 状态}
+
+        full=False时只对stat不一致的文件计算摘要;full=True时所有已索引文件都重新计算
+        """
+        results = {}
+        suspects = []
+        for filepath in filepaths:
+            status, need_hash = self._stat_check(filepath)
+            if need_hash or (full and status == OK):
+                suspects.append(filepath)
+            else:
+                results[filepath] = status
+
+        if suspects:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for filepath, status in zip(suspects, pool.map(self._rehash, suspects)):
+                    results[filepath] = status
+        return results
+
+    def save(self):
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            # 临时文件名包含进程号,多个进程同时保存同一个索引时不会互相覆盖临时文件
+            tmp_path = self.path.with_name(f"{INDEX_FILENAME}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=1, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = 0
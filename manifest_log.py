@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式资源清单
+每下载完成一个资源就向manifest.jsonl追加一行记录,中断后已完成的记录不会丢失,
+最后再压缩(compact)成原来的manifest.json格式
+使用方法:
+  python manifest_log.py <manifest.jsonl> [manifest.json]   # 手动压缩清单
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+class ManifestLog:
+    """只追加的JSON Lines清单
+
+    记录类型:
+      {"type": "page", "url": ..., "time": ...}                         页面开始抓取
+      {"type": "discovered", "category": ..., "urls": [...]}             发现的资源列表
+      {"type": "resource", "url": ..., "category": ..., "status": ...}   单个资源下载结果
+      {"type": "blocked", "category": ..., "urls": [...]}                浏览器端屏蔽未下载的资源
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def open(self):
+        if self._file is None:
+            # 行缓冲 + 每条记录flush,进程崩溃时最多丢失正在写的一行
+            self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+        return self
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append(self, record):
+        """追加一条记录(线程安全)"""
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                self.open()
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def page(self, url):
+        self.append({'type': 'page', 'url': url, 'time': time.strftime('%Y-%m-%d %H:%M:%S')})
+
+    def discovered(self, category, urls):
+        if urls:
+            self.append({'type': 'discovered', 'category': category, 'urls': list(urls)})
+
+    def resource(self, url, category, status, path=None, size=None, error=None, warc=None):
+        record = {'type': 'resource', 'url': url, 'category': category, 'status': status}
+        if path is not None:
+            record['path'] = path
+        if size is not None:
+            record['size'] = size
+        if warc is not None:
+            # WARC归档中的位置 {filename, offset, length}
+            record['warc'] = warc
+        if error is not None:
+            record['error'] = str(error)
+        self.append(record)
+
+
+def iter_records(path):
+    """逐行读取清单记录,跳过中断时写了一半的行"""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def load_completed(path):
+    """读取已成功下载的资源 {url: record},用于断点续传
+
+    只保留每个URL的最后一条resource记录,内存占用与资源数成正比,不需要解析整个manifest.json
+    """
+    latest = {}
+    for record in iter_records(path):
+        if record.get('type') == 'resource':
+            latest[record['url']] = record
+    return {url: rec for url, rec in latest.items() if rec.get('status') == 'ok'}
+
+
+def _extend_unique(target, urls):
+    """把urls中没出现过的URL按顺序追加到target"""
+    seen = set(target)
+    for url in urls:
+        if url not in seen:
+            seen.add(url)
+            target.append(url)
+
+
+def compact(jsonl_path, json_path=None):
+    """把manifest.jsonl压缩成manifest.json格式(url, download_time, resources, statistics)
+    
+    有被屏蔽的资源时额外输出blocked: {类别: [url, ...]}
+    """
+    jsonl_path = Path(jsonl_path)
+    if json_path is None:
+        json_path = jsonl_path.with_suffix('.json')
+
+    page_url = None
+    download_time = None
+    resources = {}
+    blocked = {}
+    results = {}
+
+    for record in iter_records(jsonl_path):
+        rtype = record.get('type')
+        if rtype == 'page':
+            page_url = record.get('url', page_url)
+            download_time = record.get('time', download_time)
+        elif rtype == 'discovered':
+            _extend_unique(resources.setdefault(record['category'], []), record.get('urls', []))
+        elif rtype == 'resource':
+            results[record['url']] = record
+        elif rtype == 'blocked':
+            # 续传时每次运行都会重新记录同样的URL
+            _extend_unique(blocked.setdefault(record['category'], []), record.get('urls', []))
+
+    # 统计以每个URL的最终结果为准
+    stats = {}
+    for res_type, urls in resources.items():
+        if urls:
+            success = sum(1 for url in urls if results.get(url, {}).get('status') == 'ok')
+            stats[res_type] = {'total': len(urls), 'success': success}
+
+    manifest = {
+        'url': page_url,
+        'download_time': download_time or time.strftime('%Y-%m-%d %H:%M:%S'),
+        'resources': resources,
+        'statistics': stats
+    }
+    if blocked:
+        manifest['blocked'] = blocked
+
+    # 先写临时文件再替换,避免压缩过程中断留下半个manifest.json
+    tmp_path = Path(str(json_path) + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, json_path)
+    return manifest
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("使用方法: python manifest_log.py <manifest.jsonl> [manifest.json]")
+        sys.exit(1)
+    jsonl_path = sys.argv[1]
+    json_path = sys.argv[2] if len(sys.argv) > 2 else None
+    manifest = compact(jsonl_path, json_path)
+    for res_type, stat in manifest['statistics'].items():
+        print(f"{res_type:12}: {stat['success']}/{stat['total']} 成功")
+
+
+if __name__ == "__main__":
+    main()
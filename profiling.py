@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抓取过程的分阶段计时与性能分析
+  - PhaseTimer: 记录每个阶段的次数和耗时,输出汇总表、timing.json和历史记录
+  - 可以对任意阶段启用cProfile或采样分析器(sampling),结果保存在输出目录
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class SamplingProfiler:
+    """低开销的采样分析器: 后台线程定期记录目标线程的调用栈
+
+    适合分析大部分时间花在等待浏览器/网络上的阶段,cProfile在这种情况下开销偏大
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        """开始(或继续)采样,多次start/stop的结果累加;同一阶段可能在不同线程中进入"""
+        if thread_id:
+            self.thread_id = thread_id
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def dump(self, path):
+        """保存为flamegraph.pl/speedscope可读的折叠栈格式"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, limit=15):
+        """按采样次数排序的栈顶函数"""
+        leaf = Counter()
+        for stack, count in self.stacks.items():
+            leaf[stack.rsplit(';', 1)[-1]] += count
+        lines = []
+        for func, count in leaf.most_common(limit):
+            lines.append(f"{count / max(self.samples, 1) * 100:6.1f}%  {func}")
+        return '\n'.join(lines)
+
+
+class PhaseTimer:
+    """分阶段计时器(线程安全)
+
+    profile_phases: 需要性能分析的阶段名称
+    profiler: 'cprofile' 或 'sampling'
+    """
+
+    def __init__(self, output_dir=None, profile_phases=(), profiler='cprofile'):
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.profile_phases = set(profile_phases)
+        self.profiler = profiler
+        self.phases = {}
+        self.profiles = {}
+        # 每个分析阶段一个分析器,每次进入阶段时启用、退出时停用,结果累加
+        self._profilers = {}
+        self._profiled = Counter()
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._profiling = False
+
+    def record(self, name, seconds):
+        with self._lock:
+            stat = self.phases.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stat['count'] += 1
+            stat['total'] += seconds
+            stat['max'] = max(stat['max'], seconds)
+
+    @contextmanager
+    def phase(self, name):
+        """计时一个阶段,阶段在profile_phases中时同时做性能分析"""
+        profiler = self._start_profiler(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+            if profiler:
+                self._stop_profiler(name, profiler)
+
+    def _start_profiler(self, name):
+        # 同一时间只分析一个阶段(cProfile不能嵌套启用)
+        # 多个下载线程会同时进入同一阶段,检查和设置标记需要加锁
+        if name not in self.profile_phases:
+            return None
+        with self._lock:
+            if self._profiling:
+                return None
+            self._profiling = True
+            profiler = self._profilers.get(name)
+            if profiler is None:
+                profiler = SamplingProfiler() if self.profiler == 'sampling' else cProfile.Profile()
+                self._profilers[name] = profiler
+            self._profiled[name] += 1
+        if isinstance(profiler, SamplingProfiler):
+            profiler.start(threading.get_ident())
+        else:
+            profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, name, profiler):
+        try:
+            if isinstance(profiler, SamplingProfiler):
+                profiler.stop()
+            else:
+                profiler.disable()
+        finally:
+            # 分析器停止后才允许其他线程开始分析
+            with self._lock:
+                self._profiling = False
+
+    def _profile_summary(self, profiler):
+        if isinstance(profiler, SamplingProfiler):
+            return profiler.top()
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(15)
+        return stream.getvalue()
+
+    def dump_profiles(self):
+        """每个分析阶段保存一个文件(所有进入该阶段的累计结果)"""
+        if not self.output_dir:
+            return self.profiles
+        for name, profiler in self._profilers.items():
+            if isinstance(profiler, SamplingProfiler):
+                path = self.output_dir / f"profile_{name}.folded"
+                profiler.dump(path)
+            else:
+                path = self.output_dir / f"profile_{name}.prof"
+                profiler.dump_stats(str(path))
+            self.profiles[name] = str(path)
+        return self.profiles
+
+    def wall_time(self):
+        return time.perf_counter() - self._start
+
+    def summary(self):
+        """打印各阶段耗时汇总表"""
+        wall = self.wall_time()
+        print(f"\n{'阶段':24} {'次数':>6} {'总耗时(s)':>10} {'平均(s)':>9} {'最长(s)':>9} {'占比':>7}")
+        print('-' * 72)
+        for name, stat in sorted(self.phases.items(), key=lambda item: -item[1]['total']):
+            avg = stat['total'] / stat['count']
+            share = stat['total'] / wall * 100 if wall else 0
+            print(f"{name:24} {stat['count']:6} {stat['total']:10.2f} {avg:9.3f} {stat['max']:9.3f} {share:6.1f}%")
+        print('-' * 72)
+        print(f"{'总耗时':24} {'':6} {wall:10.2f}")
+        print("(嵌套阶段的耗时包含在外层阶段中,下载线程的耗时为各线程之和)")
+        for name, profiler in self._profilers.items():
+            # 同一时间只分析一个阶段,多线程并发进入时只有部分调用被分析
+            count = self.phases.get(name, {}).get('count', 0)
+            print(f"\n  性能分析 [{name}] (分析了 {self._profiled[name]}/{count} 次):\n"
+                  f"{self._profile_summary(profiler)}")
+
+    def report(self, **extra):
+        """生成JSON报告"""
+        phases = {}
+        for name, stat in self.phases.items():
+            phases[name] = {
+                'count': stat['count'],
+                'total': round(stat['total'], 4),
+                'avg': round(stat['total'] / stat['count'], 4),
+                'max': round(stat['max'], 4)
+            }
+        report = {
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+            'wall_time': round(self.wall_time(), 4),
+            'phases': phases,
+            'profiles': self.profiles
+        }
+        report.update(extra)
+        return report
+
+    def save(self, filename='timing.json', history='timing_history.jsonl', **extra):
+        """保存timing.json和性能分析文件,并向历史记录追加一行用于跟踪性能回退"""
+        if not self.output_dir:
+            return self.report(**extra)
+        self.dump_profiles()
+        report = self.report(**extra)
+        with open(self.output_dir / filename, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        if history:
+            with open(self.output_dir / history, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(report, ensure_ascii=False) + '\n')
+        return report
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按优先级调度下载并划分带宽
+  - 优先级: 关键的JS/CSS最先,其次字体和图片,大型媒体最后
+  - 大型媒体(视频或超过LARGE_MEDIA_BYTES的响应)最多占用总带宽的bulk_share,
+    大文件下载时小的关键文件仍然能很快完成
+"""
+
+import re
+import threading
+import time
+
+import requests
+
+
+# 优先级类别(数值越小越先下载)
+CRITICAL = 0   # JS/CSS
+NORMAL = 1     # 字体、图片
+BULK = 2       # 视频和其他大文件
+
+PRIORITY_NAMES = {CRITICAL: 'critical', NORMAL: 'normal', BULK: 'bulk'}
+
+CATEGORY_PRIORITY = {
+    'javascript': CRITICAL,
+    'css': CRITICAL,
+    'fonts': NORMAL,
+    'images': NORMAL,
+    'videos': BULK,
+    'other': BULK,
+}
+
+# 超过这个大小的响应按大型媒体限速
+LARGE_MEDIA_BYTES = 5 * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+
+def priority_of(category):
+    return CATEGORY_PRIORITY.get(category, NORMAL)
+
+
+def parse_rate(value):
+    """解析带宽设置: '2M' -> 2097152 字节/秒, '500K', '1048576'; 空值表示不限速"""
+    if not value:
+        return None
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMG]?)B?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"无效的带宽设置: {value}")
+    number, unit = match.groups()
+    return int(float(number) * {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[unit.upper()])
+
+
+class TokenBucket:
+    """令牌桶限速(线程安全),rate为None时不限速"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = rate
+        self.tokens = rate or 0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        """取出nbytes个令牌,不够时等待"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # 单次请求超过桶容量时允许透支,之后按速率补足
+                if self.tokens >= min(nbytes, self.capacity):
+                    self.tokens -= nbytes
+                    return
+                wait = (min(nbytes, self.capacity) - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BandwidthScheduler:
+    """按优先级类别划分带宽
+
+    total_rate: 总带宽(字节/秒),None表示不限速
+    bulk_share: 大型媒体最多占用的总带宽比例
+    """
+
+    def __init__(self, total_rate=None, bulk_share=0.3, large_bytes=LARGE_MEDIA_BYTES):
+        self.total = TokenBucket(total_rate)
+        self.bulk = TokenBucket(total_rate * bulk_share if total_rate else None)
+        self.large_bytes = large_bytes
+        self.bytes_by_class = {CRITICAL: 0, NORMAL: 0, BULK: 0}
+        self._lock = threading.Lock()
+
+    def throttle(self, priority, nbytes):
+        if priority == BULK:
+            self.bulk.consume(nbytes)
+        self.total.consume(nbytes)
+        with self._lock:
+            self.bytes_by_class[priority] += nbytes
+
+    def fetch(self, url, category, headers=None, timeout=30):
+        """流式下载并按优先级限速,返回(内容, 响应)"""
+        priority = priority_of(category)
+        response = requests.get(url, headers=headers or HEADERS, timeout=timeout, stream=True)
+        try:
+            response.raise_for_status()
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit() and int(length) > self.large_bytes:
+                priority = BULK
+
+            chunks = []
+            received = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                chunks.append(chunk)
+                received += len(chunk)
+                # 没有Content-Length的大响应下载到一定大小后也降级
+                if received > self.large_bytes:
+                    priority = BULK
+                self.throttle(priority, len(chunk))
+            return b''.join(chunks), response
+        finally:
+            response.close()
+
+    def print_stats(self, indent=''):
+        parts = [f"{PRIORITY_NAMES[p]} {n / 1024 / 1024:.1f}MB" for p, n in self.bytes_by_class.items()]
+        print(f"{indent}带宽使用: " + ", ".join(parts))
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+URL规范化与去重
+download_website.py和batch_download.py共用:
+  - 把相对/绝对/带?v=后缀的同一资源归一成同一个规范URL
+  - 可配置保留哪些查询参数
+  - 为规范URL分配不冲突的本地文件名
+  - 统计避免了多少次重复下载
+"""
+
+import hashlib
+import re
+import threading
+from urllib.parse import urljoin, urlsplit, urlunsplit, unquote, unquote_plus
+
+
+# 常见的缓存破坏参数,保留全部参数时也会去掉
+CACHE_BUSTING_PARAMS = {'v', 'ver', 'version', '_', 't', 'ts', 'timestamp', 'cb', 'hash'}
+
+# Windows下不能出现在文件名中的字符
+_INVALID_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize_url(url, base=None, keep_params='*'):
+    """返回规范URL,不可下载的URL(data:, blob:, javascript:等)返回None
+
+    keep_params:
+      '*'           保留除缓存破坏参数外的所有参数(默认,/getfile?id=1和?id=2是不同的资源)
+      ['id', ...]   只保留列出的参数
+      ()            去掉所有查询参数
+    """
+    if not url:
+        return None
+    url = url.strip()
+    try:
+        if base and not url.startswith(('http://', 'https://')):
+            url = urljoin(base, url)
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        # 格式错误的URL(例如 http://[bad/x.js 或 http://h:abc/)按无效URL处理
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS:
+        return None
+
+    # 主机名小写,去掉默认端口
+    host = (parts.hostname or '').lower()
+    if not host:
+        return None
+    netloc = host
+    if port and port != _DEFAULT_PORTS[scheme]:
+        netloc = f"{host}:{port}"
+    if parts.username:
+        auth = parts.username + (f":{parts.password}" if parts.password else '')
+        netloc = f"{auth}@{netloc}"
+
+    path = parts.path or '/'
+
+    # 过滤并排序查询参数,参数顺序不同的URL视为同一个
+    query = ''
+    if keep_params and parts.query:
+        # 保留参数的原始写法: 重新编码会把?abc改成?abc=,对服务器来说可能是不同的请求
+        params = [(unquote_plus(p.partition('=')[0]), p) for p in parts.query.split('&') if p]
+        if keep_params == '*':
+            params = [(name, p) for name, p in params if name not in CACHE_BUSTING_PARAMS]
+        else:
+            keep = set(keep_params)
+            params = [(name, p) for name, p in params if name in keep]
+        # 按参数名排序(稳定排序,同名参数保持原来的顺序)
+        query = '&'.join(p for _, p in sorted(params, key=lambda item: item[0]))
+
+    # 去掉fragment
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def parse_keep_query(value):
+    """解析--keep-query的值: '*' 保留全部(缓存破坏参数除外), 'none' 全部去掉, 'v,id' 只保留列出的参数"""
+    if value in ('*', True, ''):
+        return '*'
+    if value == 'none':
+        return ()
+    return tuple(p for p in value.split(',') if p)
+
+
+def _url_hash(url, length):
+    return hashlib.md5(url.encode()).hexdigest()[:length]
+
+
+class UrlCanonicalizer:
+    """规范化URL、去重并分配不冲突的本地文件名(线程安全)"""
+
+    def __init__(self, base=None, keep_params='*', hash_len=8):
+        self.base = base
+        self.keep_params = keep_params
+        self.hash_len = hash_len
+        self._lock = threading.Lock()
+        self._claimed = set()
+        self._names = {}   # (目录, 文件名) -> 规范URL
+        self._paths = {}   # (目录, 规范URL) -> 文件名
+        self.stats = {'seen': 0, 'unique': 0, 'redundant': 0, 'invalid': 0}
+
+    def canonicalize(self, url):
+        return canonicalize_url(url, self.base, self.keep_params)
+
+    def claim(self, url):
+        """登记一个发现的URL,返回(规范URL, 是否第一次出现)
+
+        重复出现的URL计入redundant,即避免的重复下载次数
+        """
+        canon = self.canonicalize(url)
+        with self._lock:
+            self.stats['seen'] += 1
+            if canon is None:
+                self.stats['invalid'] += 1
+                return None, False
+            if canon in self._claimed:
+                self.stats['redundant'] += 1
+                return canon, False
+            self._claimed.add(canon)
+            self.stats['unique'] += 1
+            return canon, True
+
+    def unique(self, urls):
+        """对URL列表去重,返回第一次出现的规范URL(保持顺序)"""
+        result = []
+        for url in urls:
+            canon, is_new = self.claim(url)
+            if is_new:
+                result.append(canon)
+        return result
+
+    def local_name(self, canon, directory='', default_ext='.bin'):
+        """为规范URL分配本地文件名,同一目录下不同URL不会得到同一个文件名"""
+        key = (str(directory), canon)
+        with self._lock:
+            if key in self._paths:
+                return self._paths[key]
+
+            parts = urlsplit(canon)
+            filename = unquote(parts.path).rstrip('/').split('/')[-1]
+            filename = _INVALID_FILENAME_CHARS.sub('_', filename)
+
+            if not filename or '.' not in filename:
+                # 没有可用的文件名,使用URL的hash
+                filename = f"{_url_hash(canon, self.hash_len)}{default_ext}"
+            elif parts.query or (str(directory), filename) in self._names:
+                # 保留了查询参数或文件名已被其他URL占用,加上hash后缀
+                stem, ext = filename.rsplit('.', 1)
+                filename = f"{stem[:100]}-{_url_hash(canon, self.hash_len)}.{ext}"
+            elif len(filename) > 150:
+                stem, ext = filename.rsplit('.', 1)
+                filename = f"{stem[:100]}-{_url_hash(canon, self.hash_len)}.{ext}"
+
+            self._names[(str(directory), filename)] = canon
+            self._paths[key] = filename
+            return filename
+
+    def reserve(self, canon, directory, filename):
+        """登记已存在的文件名(例如续传时上次下载的文件),避免分配给其他URL"""
+        with self._lock:
+            self._names[(str(directory), filename)] = canon
+            self._paths[(str(directory), canon)] = filename
+
+    def print_stats(self, indent=''):
+        s = self.stats
+        print(f"{indent}去重: 发现 {s['seen']} 个URL, 唯一 {s['unique']} 个, "
+              f"避免重复下载 {s['redundant']} 次, 忽略无效URL {s['invalid']} 个")
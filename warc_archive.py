@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WARC归档输出
+把抓取到的请求和响应流式写入压缩的WARC文件(每条记录单独gzip,可以随机读取),
+同时生成CDXJ索引,按URL直接定位到记录的文件和偏移量。
+大量页面时不再产生数百万个小文件,需要时再解压成普通的目录结构。
+使用方法:
+  python warc_archive.py list <归档目录>                 # 列出索引中的URL
+  python warc_archive.py lookup <归档目录> <url> [输出文件] # 按URL读取响应内容
+  python warc_archive.py extract <归档目录> <输出目录>      # 解压成js/css/images/pages/...目录
+"""
+
+import base64
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlsplit, quote
+
+from url_canon import UrlCanonicalizer
+
+
+WARC_VERSION = 'WARC/1.1'
+
+# 每个WARC文件的最大大小,超过后切换到新文件
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+# 资源类别对应的解压目录和默认扩展名
+CATEGORY_DIRS = {
+    'javascript': ('js', '.js'),
+    'css': ('css', '.css'),
+    'image': ('images', '.png'),
+    'images': ('images', '.png'),
+    'font': ('fonts', '.woff2'),
+    'fonts': ('fonts', '.woff2'),
+    'videos': ('videos', '.mp4'),
+}
+
+# requests已经解码了内容,这些头需要去掉或改写
+_HOP_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection'}
+
+
+def surt(url):
+    """排序用的URL键: https://www.Example.com/App.js?b=1 -> com,example)/App.js?b=1
+
+    只有主机名转小写,路径和查询参数区分大小写;
+    空格等字符按百分号编码,保证CDXJ每行用空格分隔的三列不被打乱
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return ','.join(reversed(host.split('.'))) + ')' + quote(path, safe="/?=&;:@!$'()*+,~%")
+
+
+def _warc_date():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def _digest(data):
+    return 'sha1:' + base64.b32encode(hashlib.sha1(data).digest()).decode('ascii')
+
+
+class WarcWriter:
+    """流式写入.warc.gz文件和CDXJ索引(线程安全)"""
+
+    def __init__(self, directory, prefix='capture', max_size=DEFAULT_MAX_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # 文件名包含进程号,多个进程可以写入同一个目录
+        self.prefix = f"{prefix}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self.max_size = max_size
+        self.index_path = self.directory / f"{self.prefix}.cdxj"
+        self._lock = threading.Lock()
+        self._serial = 0
+        self._file = None
+        self._filename = None
+        self._index = open(self.index_path, 'a', encoding='utf-8')
+
+    def _open_next(self):
+        if self._file:
+            self._file.close()
+        self._filename = f"{self.prefix}-{self._serial:05d}.warc.gz"
+        self._serial += 1
+        self._file = open(self.directory / self._filename, 'ab')
+        info = f"software: AutoAcademy download_website\r\nformat: {WARC_VERSION}\r\n".encode('utf-8')
+        self._write('warcinfo', None, info, 'application/warc-fields', {'WARC-Filename': self._filename})
+
+    def _write(self, warc_type, target_uri, block, content_type, extra=None):
+        """写入一条单独gzip压缩的记录,返回(文件名, 偏移, 压缩后长度, 记录ID)"""
+        record_id = f"<urn:uuid:{uuid.uuid4()}>"
+        headers = [
+            ('WARC-Type', warc_type),
+            ('WARC-Record-ID', record_id),
+            ('WARC-Date', _warc_date()),
+        ]
+        if target_uri:
+            headers.append(('WARC-Target-URI', target_uri))
+        headers.extend((extra or {}).items())
+        headers.append(('Content-Type', content_type))
+        headers.append(('Content-Length', str(len(block))))
+        head = WARC_VERSION + '\r\n' + ''.join(f"{k}: {v}\r\n" for k, v in headers) + '\r\n'
+        data = gzip.compress(head.encode('utf-8') + block + b'\r\n\r\n')
+        offset = self._file.tell()
+        self._file.write(data)
+        return self._filename, offset, len(data), record_id
+
+    def _ensure_file(self):
+        if self._file is None or self._file.tell() >= self.max_size:
+            self._open_next()
+
+    def write_response(self, url, status, reason, headers, body, category=None, request_headers=None):
+        """写入请求和响应记录并更新索引,返回索引项"""
+        # 内容已经解码,去掉压缩/分块相关的头并改写Content-Length
+        lines = [f"HTTP/1.1 {status} {reason or ''}".rstrip()]
+        mime = ''
+        for name, value in headers.items():
+            if name.lower() in _HOP_HEADERS:
+                continue
+            if name.lower() == 'content-type':
+                mime = value.split(';')[0].strip()
+            lines.append(f"{name}: {value}")
+        lines.append(f"Content-Length: {len(body)}")
+        http_block = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8', 'replace') + body
+
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        req_lines = [f"GET {path} HTTP/1.1", f"Host: {parts.netloc}"]
+        req_lines += [f"{k}: {v}" for k, v in (request_headers or {}).items()]
+        request_block = ('\r\n'.join(req_lines) + '\r\n\r\n').encode('utf-8', 'replace')
+
+        digest = _digest(body)
+        with self._lock:
+            self._ensure_file()
+            filename, offset, length, record_id = self._write(
+                'response', url, http_block, 'application/http; msgtype=response',
+                {'WARC-Payload-Digest': digest}
+            )
+            self._write('request', url, request_block, 'application/http; msgtype=request',
+                        {'WARC-Concurrent-To': record_id})
+            entry = {
+                'url': url, 'mime': mime, 'status': str(status), 'digest': digest,
+                'length': str(length), 'offset': str(offset), 'filename': filename
+            }
+            if category:
+                entry['category'] = category
+            self._write_index(url, entry)
+            self._file.flush()
+        return entry
+
+    def write_resource(self, url, body, content_type, category=None):
+        """写入resource记录(例如渲染后的页面HTML),返回索引项"""
+        with self._lock:
+            self._ensure_file()
+            filename, offset, length, _ = self._write(
+                'resource', url, body, content_type, {'WARC-Payload-Digest': _digest(body)}
+            )
+            entry = {
+                'url': url, 'mime': content_type.split(';')[0], 'status': '200',
+                'digest': _digest(body), 'length': str(length), 'offset': str(offset),
+                'filename': filename
+            }
+            if category:
+                entry['category'] = category
+            self._write_index(url, entry)
+            self._file.flush()
+        return entry
+
+    def _write_index(self, url, entry):
+        timestamp = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+        self._index.write(f"{surt(url)} {timestamp} {json.dumps(entry, ensure_ascii=False)}\n")
+        self._index.flush()
+
+    def close(self):
+        """关闭文件并把索引按URL排序(便于二分查找)"""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            self._index.close()
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                lines = sorted(f)
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+
+
+class WarcIndex:
+    """读取目录下所有CDXJ索引,按URL查找记录"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        lines = []
+        for index_path in sorted(self.directory.glob('*.cdxj')):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                lines.extend(line.rstrip('\n') for line in f if line.strip())
+        lines.sort()
+        self.keys = [line.split(' ', 1)[0] for line in lines]
+        self.lines = lines
+
+    def __iter__(self):
+        for line in self.lines:
+            yield json.loads(line.split(' ', 2)[2])
+
+    def lookup(self, url):
+        """返回URL最新的索引项,没有时返回None"""
+        key = surt(url)
+        lo = bisect.bisect_left(self.keys, key)
+        hi = bisect.bisect_right(self.keys, key)
+        # 同一URL按时间戳排序,取最后一条;去掉www.等规则使不同URL可能得到同一个键,需要比较原始URL
+        for line in reversed(self.lines[lo:hi]):
+            entry = json.loads(line.split(' ', 2)[2])
+            if entry['url'] == url:
+                return entry
+        return None
+
+    def read(self, entry):
+        """按索引项读取记录,返回(WARC头, HTTP头, 内容)"""
+        with open(self.directory / entry['filename'], 'rb') as f:
+            f.seek(int(entry['offset']))
+            data = gzip.decompress(f.read(int(entry['length'])))
+        head, _, rest = data.partition(b'\r\n\r\n')
+        warc_headers = _parse_headers(head.decode('utf-8').split('\r\n')[1:])
+        block = rest[:int(warc_headers.get('content-length', len(rest)))]
+        if warc_headers.get('warc-type') != 'response':
+            return warc_headers, {}, block
+        http_head, _, body = block.partition(b'\r\n\r\n')
+        http_headers = _parse_headers(http_head.decode('utf-8', 'replace').split('\r\n')[1:])
+        return warc_headers, http_headers, body
+
+
+def _parse_headers(lines):
+    headers = {}
+    for line in lines:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def extract(archive_dir, out_dir):
+    """把归档解压成普通的目录结构(js/css/images/fonts/other)
+
+    渲染后的页面HTML保存到pages目录,每个页面URL一个文件
+    """
+    index = WarcIndex(archive_dir)
+    out_dir = Path(out_dir)
+    canon = UrlCanonicalizer()
+    latest = {}
+    for entry in index:
+        latest[entry['url']] = entry
+    count = 0
+    for url, entry in latest.items():
+        if not entry.get('status', '').startswith('2'):
+            continue
+        sub, ext = CATEGORY_DIRS.get(entry.get('category'), ('other', '.bin'))
+        if entry.get('category') == 'page':
+            # 多个页面共用一个归档时不能都写到index_rendered.html
+            sub, ext = 'pages', '.html'
+        save_dir = out_dir / sub
+        filename = canon.local_name(url, save_dir, ext)
+        save_dir.mkdir(parents=True, exist_ok=True)
+        _, _, body = index.read(entry)
+        with open(save_dir / filename, 'wb') as f:
+            f.write(body)
+        count += 1
+    print(f"✓ 已解压 {count} 个文件到: {out_dir.absolute()}")
+    return count
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ('list', 'lookup', 'extract'):
+        print(__doc__)
+        sys.exit(1)
+    command, archive_dir = sys.argv[1], sys.argv[2]
+    if command == 'list':
+        for entry in WarcIndex(archive_dir):
+            print(f"{entry['status']:4} {entry.get('category', ''):12} {entry['url']}")
+    elif command == 'lookup':
+        index = WarcIndex(archive_dir)
+        entry = index.lookup(sys.argv[3])
+        if entry is None:
+            print(f"❌ 索引中没有: {sys.argv[3]}")
+            sys.exit(1)
+        _, http_headers, body = index.read(entry)
+        if len(sys.argv) > 4:
+            Path(sys.argv[4]).write_bytes(body)
+            print(f"✓ {entry['url']} ({len(body):,} bytes) -> {sys.argv[4]}")
+        else:
+            print(json.dumps(entry, indent=2, ensure_ascii=False))
+            print(json.dumps(http_headers, indent=2, ensure_ascii=False))
+    else:
+        extract(archive_dir, sys.argv[3])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于SQLite的本地下载任务队列
+多个下载进程(或共享同一文件系统的多台机器)从同一个数据库领取任务:
+  - 按规范URL全局去重(多个页面共用的资源只下载到第一个入队页面的目录)
+  - 领取任务时加租约(lease),工作进程定期心跳续约
+  - 租约过期的任务(进程崩溃/被杀)自动回收给其他进程
+  - 进度集中记录在数据库中
+"""
+
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    url           TEXT PRIMARY KEY,
+    category      TEXT NOT NULL,
+    priority      INTEGER NOT NULL DEFAULT 1,
+    root          TEXT NOT NULL,
+    path          TEXT NOT NULL,
+    source        TEXT,
+    status        TEXT NOT NULL DEFAULT 'pending',
+    lease_owner   TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    size          INTEGER,
+    sha256        TEXT,
+    error         TEXT,
+    updated       REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, lease_expires);
+CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks(status, priority);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id  TEXT PRIMARY KEY,
+    host       TEXT,
+    pid        INTEGER,
+    started    REAL,
+    heartbeat  REAL,
+    done       INTEGER NOT NULL DEFAULT 0,
+    failed     INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# 任务状态
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def new_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class WorkQueue:
+    """下载任务队列
+
+    每个进程/线程使用自己的WorkQueue实例(sqlite连接不能跨进程共享)。
+    多台机器共享网络文件系统时不要启用WAL,默认使用回滚日志。
+    """
+
+    def __init__(self, db_path, lease_seconds=120, max_attempts=3, wal=False):
+        self.db_path = str(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # isolation_level=None: 自己控制事务,领取任务时用BEGIN IMMEDIATE加写锁
+        self.conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        if wal:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+
+    def _migrate(self):
+        """旧版本数据库没有priority列"""
+        columns = [row['name'] for row in self.conn.execute("PRAGMA table_info(tasks)")]
+        if columns and 'priority' not in columns:
+            self.conn.execute("ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 1")
+
+    def close(self):
+        self.conn.close()
+
+    def _write(self):
+        """写事务: 立即获取写锁,避免多个进程领取到同一批任务"""
+        return _Transaction(self.conn)
+
+    def enqueue(self, tasks, source=None):
+        """添加任务 [(url, category, root, path, priority), ...],已存在的URL忽略
+
+        返回(新增数量, 重复数量)
+        """
+        now = time.time()
+        added = 0
+        with self._write():
+            for url, category, root, path, priority in tasks:
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO tasks (url, category, priority, root, path, source, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, category, priority, str(root), str(path), source, now)
+                )
+                added += cur.rowcount
+            if len(tasks) - added:
+                self.conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('duplicates', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                    (len(tasks) - added,)
+                )
+        return added, len(tasks) - added
+
+    def register_worker(self, worker_id):
+        now = time.time()
+        with self._write():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, host, pid, started, heartbeat) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (worker_id, socket.gethostname(), os.getpid(), now, now)
+            )
+
+    def _reclaim(self, now):
+        """回收租约过期的任务,返回回收数量(需在写事务中调用)"""
+        cur = self.conn.execute(
+            "UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires = NULL, updated = ? "
+            "WHERE status = ? AND lease_expires < ?",
+            (PENDING, now, LEASED, now)
+        )
+        return cur.rowcount
+
+    def reclaim_stale(self):
+        with self._write():
+            return self._reclaim(time.time())
+
+    def lease(self, worker_id, batch_size=20):
+        """领取一批任务(优先级高的先领取),返回[sqlite3.Row, ...]"""
+        now = time.time()
+        with self._write():
+            self._reclaim(now)
+            rows = self.conn.execute(
+                "SELECT * FROM tasks WHERE status = ? ORDER BY priority, rowid LIMIT ?",
+                (PENDING, batch_size)
+            ).fetchall()
+            if rows:
+                self.conn.executemany(
+                    "UPDATE tasks SET status = ?, lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE url = ?",
+                    [(LEASED, worker_id, now + self.lease_seconds, now, row['url']) for row in rows]
+                )
+        return rows
+
+    def heartbeat(self, worker_id):
+        """心跳: 更新工作进程状态并为其持有的任务续约"""
+        now = time.time()
+        with self._write():
+            self.conn.execute("UPDATE workers SET heartbeat = ? WHERE worker_id = ?", (now, worker_id))
+            self.conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE status = ? AND lease_owner = ?",
+                (now + self.lease_seconds, LEASED, worker_id)
+            )
+
+    def complete(self, worker_id, url, size=None, sha256=None):
+        now = time.time()
+        with self._write():
+            row = self.conn.execute("SELECT lease_owner FROM tasks WHERE url = ?", (url,)).fetchone()
+            cur = self.conn.execute(
+                "UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                "size = ?, sha256 = ?, error = NULL, updated = ? "
+                "WHERE url = ? AND status != ?",
+                (DONE, size, sha256, now, url, DONE)
+            )
+            # 租约已被回收时结果仍然有效(任务标记为完成,其他进程不必再下载),只是不计入本进程的完成数
+            if cur.rowcount and row and row['lease_owner'] == worker_id:
+                self.conn.execute("UPDATE workers SET done = done + 1 WHERE worker_id = ?", (worker_id,))
+
+    def fail(self, worker_id, url, error):
+        """下载失败: 未超过最大重试次数时放回队列"""
+        now = time.time()
+        with self._write():
+            row = self.conn.execute(
+                "SELECT attempts FROM tasks WHERE url = ? AND lease_owner = ?", (url, worker_id)
+            ).fetchone()
+            if row is None:
+                return
+            status = FAILED if row['attempts'] >= self.max_attempts else PENDING
+            self.conn.execute(
+                "UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                "error = ?, updated = ? WHERE url = ?",
+                (status, str(error), now, url)
+            )
+            self.conn.execute("UPDATE workers SET failed = failed + 1 WHERE worker_id = ?", (worker_id,))
+
+    def progress(self):
+        """返回({状态: 数量}, 重复URL数量, [工作进程信息])"""
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for row in self.conn.execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status"):
+            counts[row['status']] = row['n']
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'duplicates'").fetchone()
+        duplicates = row['value'] if row else 0
+        workers = [dict(row) for row in self.conn.execute("SELECT * FROM workers ORDER BY started")]
+        return counts, duplicates, workers
+
+    def done_tasks(self):
+        """已完成的任务(root, path, url, size, sha256),用于更新各输出目录的完整性索引"""
+        return self.conn.execute(
+            "SELECT root, path, url, size, sha256 FROM tasks WHERE status = ? ORDER BY root",
+            (DONE,)
+        ).fetchall()
+
+    def claim_index_update(self):
+        """全部任务结束后只让一个进程合并完整性索引
+
+        已完成的任务数与上次合并时不同,且队列中没有待处理的任务时,第一个调用的进程返回True
+        """
+        with self._write():
+            if not self.is_finished():
+                return False
+            done = self.conn.execute(
+                "SELECT COUNT(*) AS n FROM tasks WHERE status = ?", (DONE,)
+            ).fetchone()['n']
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'index_merged'").fetchone()
+            if row and row['value'] == done:
+                return False
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('index_merged', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (done,)
+            )
+            return True
+
+    def is_finished(self):
+        """没有待领取和正在下载的任务"""
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS n FROM tasks WHERE status IN (?, ?)", (PENDING, LEASED)
+        ).fetchone()
+        return row['n'] == 0
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")